@@ -0,0 +1,120 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+from fastapi import Depends, HTTPException
+
+# Admission control for expensive routes: each route class gets a fixed
+# number of concurrent slots and a bounded wait queue. When the queue is
+# full (or a request waits too long) it is turned away at once with 503 and
+# a Retry-After estimate, so a burst of heavy requests cannot starve the
+# cheap ones (test delivery) sharing the worker.
+#
+# Limits are per worker process. Configure with
+# ADMISSION_<NAME>_CONCURRENCY / _QUEUE / _TIMEOUT, e.g. ADMISSION_AUDIO_QUEUE=16.
+
+def _limit(name: str, setting: str, default):
+    value = os.getenv(f"ADMISSION_{name.upper()}_{setting}")
+    return type(default)(value) if value not in (None, "") else default
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = _limit(name, "CONCURRENCY", max_concurrent)
+        self.max_queue = _limit(name, "QUEUE", max_queue)
+        self.queue_timeout = _limit(name, "TIMEOUT", float(queue_timeout)) # seconds
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting_seen = 0
+        self.admitted = 0
+        self.rejected = 0 # queue full
+        self.timed_out = 0 # waited longer than queue_timeout
+        self.total_wait = 0.0
+        self.avg_service = 0.0 # EWMA of time holding a slot
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from the recent service time."""
+        backlog = (self.waiting + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(self.avg_service * backlog))
+
+    def _reject(self, reason: str):
+        return HTTPException(
+            status_code=503,
+            detail=f"Server busy ({self.name}): {reason}, try again shortly",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    @asynccontextmanager
+    async def admit(self):
+        started = time.monotonic()
+        if not self._slots.locked():
+            await self._slots.acquire() # A slot is free: returns without waiting
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise self._reject("queue is full")
+            self.waiting += 1
+            self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise self._reject("timed out waiting for a slot")
+            finally:
+                self.waiting -= 1
+
+        admitted_at = time.monotonic()
+        self.total_wait += admitted_at - started
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            service = time.monotonic() - admitted_at
+            self.avg_service = service if self.admitted == 1 else 0.8 * self.avg_service + 0.2 * service
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting_seen,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(1000 * self.total_wait / self.admitted, 2) if self.admitted else 0.0,
+            "avg_service_ms": round(1000 * self.avg_service, 2),
+        }
+
+
+# Route classes, roughly by cost. Cheap routes (item delivery, cognitive
+# puzzles) are deliberately not limited.
+limiters: Dict[str, AdmissionLimiter] = {
+    limiter.name: limiter for limiter in (
+        AdmissionLimiter("audio", max_concurrent=4, max_queue=8, queue_timeout=10),
+        AdmissionLimiter("text_batch", max_concurrent=2, max_queue=4, queue_timeout=30),
+        AdmissionLimiter("matchmaking", max_concurrent=4, max_queue=16, queue_timeout=5),
+        AdmissionLimiter("profiles", max_concurrent=8, max_queue=32, queue_timeout=10),
+    )
+}
+
+def admission(name: str):
+    """Route dependency: `@router.post(..., dependencies=[admission("audio")])`."""
+    limiter = limiters[name]
+
+    async def admit():
+        async with limiter.admit():
+            yield
+
+    return Depends(admit)
+
+def admission_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
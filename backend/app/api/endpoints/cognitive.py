@@ -1,25 +1,38 @@
-from fastapi import APIRouter, HTTPException
-from app.engines.cognitive import CognitiveEngine
-import random
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.engines.cognitive import DIFFICULTIES
+from app.engines.puzzle_bank import get_puzzle_bank, PUZZLE_TYPES
 
 router = APIRouter()
-engine = CognitiveEngine()
 
 @router.get("/generate")
 def generate_puzzle(type: str, difficulty: int = 1):
-    if type == "abstract":
-        puzzle = engine.generate_abstract_matrix(difficulty)
-    elif type == "numerical":
-        puzzle = engine.generate_numerical_series(difficulty)
-    elif type == "verbal":
-        puzzle = engine.generate_verbal_syllogism(difficulty)
-    else:
+    if type not in PUZZLE_TYPES:
         raise HTTPException(status_code=400, detail="Invalid puzzle type")
-    
-    # Shuffle options
-    options = puzzle["options"]
-    correct_option = options[puzzle["correct_index"]]
-    random.shuffle(options)
-    puzzle["correct_index"] = options.index(correct_option)
-    
+
+    # Served from the pre-generated bank; options are already shuffled
+    puzzle = get_puzzle_bank().sample(type, difficulty)
+    if puzzle is None:
+        raise HTTPException(status_code=503, detail="Puzzle bank is empty")
     return puzzle
+
+@router.get("/test")
+def generate_test(
+    items: int = Query(20, ge=1, le=100, description="Upper bound: puzzles are never repeated, so a form runs short when its types/difficulty run out"),
+    types: str = Query(",".join(PUZZLE_TYPES), description="Comma-separated puzzle types, used in rotation"),
+    difficulty: Optional[int] = Query(None, ge=DIFFICULTIES[0], le=DIFFICULTIES[-1], description="Fixed level; default ramps from easy to hard"),
+    seed: Optional[int] = Query(None, description="Same seed, same form"),
+):
+    """A whole reasoning test form in one response (shortfall = requested items that could not be filled without repeats)."""
+    type_list = [t.strip() for t in types.split(",") if t.strip()]
+    invalid = [t for t in type_list if t not in PUZZLE_TYPES]
+    if not type_list or invalid:
+        raise HTTPException(status_code=400, detail="Invalid puzzle type")
+
+    form = get_puzzle_bank().build_form(items, type_list, difficulty, seed)
+    return {
+        "seed": seed,
+        "count": len(form),
+        "shortfall": items - len(form),
+        "items": form
+    }
@@ -1,38 +1,105 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import List
 from app.engines.language import LanguageEngine
-import shutil
-import os
-import tempfile
+from app.engines.audio import decode_request, AudioTooLarge, AudioDecodeError, AudioUploadError
+from app.engines.transcription import transcription_service, QueueFull
+from app.admission import admission
 
 router = APIRouter()
 engine = LanguageEngine()
 
-@router.post("/analyze/audio")
-async def analyze_audio(file: UploadFile = File(...)):
-    # Save temp file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
-    
+# Fallback for demo if FFmpeg is missing
+SIMULATED_AUDIO_RESULT = {
+    "transcription": "(Simulación) I listened to the client's concerns and proposed a solution that addressed their immediate needs while managing expectations.",
+    "analysis": {
+        "word_count": 25,
+        "unique_words": 20,
+        "lexical_diversity": 0.8,
+        "estimated_cefr": "B2"
+    },
+    "warning": "FFmpeg missing. Using simulated analysis."
+}
+
+# The upload is parsed from the raw body (see engines/audio.py), so the
+# multipart "file" field is declared here for the OpenAPI docs only.
+AUDIO_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+def _queue_full():
+    return HTTPException(
+        status_code=503,
+        detail="Transcription queue is full, try again shortly",
+        headers={"Retry-After": "10"},
+    )
+
+async def _submit_audio(request: Request):
+    # Check before decoding so a full queue sheds load cheaply
+    if transcription_service.is_full():
+        raise _queue_full()
+    audio = await decode_request(request)
+    try:
+        return transcription_service.submit(audio)
+    except QueueFull:
+        raise _queue_full()
+
+@router.post("/analyze/audio", dependencies=[admission("audio")], openapi_extra=AUDIO_UPLOAD_BODY)
+async def analyze_audio(request: Request):
+    """Submits the recording and waits for the result (kept for existing clients)."""
     try:
-        result = engine.analyze_audio(tmp_path)
-    except Exception as e:
+        job = await _submit_audio(request)
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioUploadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AudioDecodeError as e:
         print(f"Audio analysis failed: {e}")
-        # Fallback for demo if FFmpeg is missing
-        result = {
-            "transcription": "(Simulación) I listened to the client's concerns and proposed a solution that addressed their immediate needs while managing expectations.",
-            "analysis": {
-                "word_count": 25,
-                "unique_words": 20,
-                "lexical_diversity": 0.8,
-                "estimated_cefr": "B2"
-            },
-            "warning": "FFmpeg missing. Using simulated analysis."
-        }
-    
-    if os.path.exists(tmp_path):
-        os.unlink(tmp_path)
-    return result
+        return dict(SIMULATED_AUDIO_RESULT)
+    await transcription_service.wait(job)
+    if job.status == "failed":
+        return dict(SIMULATED_AUDIO_RESULT)
+    return job.result
+
+@router.post("/analyze/audio/jobs", status_code=202, dependencies=[admission("audio")], openapi_extra=AUDIO_UPLOAD_BODY)
+async def submit_audio_job(request: Request):
+    try:
+        job = await _submit_audio(request)
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioUploadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return job.to_dict()
+
+@router.get("/analyze/audio/jobs/{job_id}")
+async def get_audio_job(job_id: str, wait: float = Query(0, ge=0, le=30)):
+    """Job status/result. With `wait`, long-polls up to that many seconds for completion."""
+    job = transcription_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait:
+        await transcription_service.wait(job, timeout=wait)
+    return job.to_dict()
+
+class TextBatchRequest(BaseModel):
+    texts: List[str] = Field(..., max_length=10000)
+
+@router.post("/analyze/text/batch", dependencies=[admission("text_batch")])
+def analyze_text_batch(request: TextBatchRequest):
+    """
+    Lexical diversity and estimated CEFR level for many essays/transcripts,
+    in request order. Runs in the threadpool since it is CPU-bound.
+    """
+    return {"results": engine.analyze_texts(request.texts)}
 
 @router.get("/sjt/generate")
 def generate_sjt():
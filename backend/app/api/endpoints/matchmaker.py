@@ -1,21 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.engines.matchmaker import MatchmakerEngine
 from app import models
+from app.admission import admission
 
 router = APIRouter()
 
 @router.get("/analyze/fit")
-def analyze_fit(candidate_id: int, job_id: int, db: Session = Depends(get_db)):
+async def analyze_fit(
+    candidate_id: int,
+    job_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
     engine = MatchmakerEngine(db)
-    result = engine.calculate_fit(candidate_id, job_id)
+    result, etag = await engine.cached_fit(candidate_id, job_id)
     if "error" in result:
         raise HTTPException(status_code=404, detail=result["error"])
+
+    # Polling dashboards revalidate with If-None-Match and get a 304
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return result
+
+@router.get("/jobs/{job_id}/rank", dependencies=[admission("matchmaking")])
+async def rank_candidates(job_id: int, top_k: int = Query(10, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    engine = MatchmakerEngine(db)
+    result = await engine.rank_candidates(job_id, top_k)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@router.get("/candidates/{candidate_id}/jobs", dependencies=[admission("matchmaking")])
+async def rank_jobs(candidate_id: int, top_k: int = Query(10, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    engine = MatchmakerEngine(db)
+    result = await engine.rank_jobs(candidate_id, top_k)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@router.get("/candidates/{candidate_id}/similar", dependencies=[admission("matchmaking")])
+async def similar_candidates(candidate_id: int, k: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    engine = MatchmakerEngine(db)
+    result = engine.similar_candidates(candidate_id, k)
+    if "error" in result:
+        raise HTTPException(status_code=result["status"], detail=result["error"])
     return result
 
 @router.post("/jobs/seed")
-def seed_job_profiles(db: Session = Depends(get_db)):
+async def seed_job_profiles(db: AsyncSession = Depends(get_async_db)):
     # Create default profiles if they don't exist
     jobs = [
         {
@@ -42,11 +82,13 @@ def seed_job_profiles(db: Session = Depends(get_db)):
     
     created = []
     for j in jobs:
-        exists = db.query(models.JobProfile).filter(models.JobProfile.title == j["title"]).first()
+        exists = (await db.execute(
+            select(models.JobProfile).where(models.JobProfile.title == j["title"])
+        )).scalars().first()
         if not exists:
             job = models.JobProfile(title=j["title"], target_profile=j["target_profile"])
             db.add(job)
             created.append(j["title"])
             
-    db.commit()
+    await db.commit()
     return {"created": created}
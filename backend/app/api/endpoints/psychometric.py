@@ -1,27 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.database import get_db
+from app.database import get_async_db
 from app.engines.psychometric import PsychometricEngine
+from app.engines.item_bank import get_item_bank_async, invalidate_item_bank, ITEM_BANK_TTL_SECONDS
 from app import schemas, models
 
 router = APIRouter()
 
+def _question(item):
+    return {
+        "id": item.id,
+        "text": item.text,
+        "trait": item.trait
+    }
+
 @router.post("/candidates/", response_model=dict)
-def create_candidate(candidate: schemas.CandidateCreate, db: Session = Depends(get_db)):
+async def create_candidate(candidate: schemas.CandidateCreate, db: AsyncSession = Depends(get_async_db)):
     db_candidate = models.Candidate(email=candidate.email, full_name=candidate.full_name)
     db.add(db_candidate)
-    db.commit()
-    db.refresh(db_candidate)
+    await db.commit()
+    await db.refresh(db_candidate)
     return {"id": db_candidate.id, "email": db_candidate.email}
 
 @router.post("/sessions/start", response_model=schemas.SessionResponse)
-def start_session(request: schemas.SessionCreate, db: Session = Depends(get_db)):
+async def start_session(request: schemas.SessionCreate, db: AsyncSession = Depends(get_async_db)):
     engine = PsychometricEngine(db)
     # Ensure data is loaded
-    engine.load_ipip_data()
+    await engine.load_ipip_data()
     
-    session = engine.initialize_session(request.candidate_id)
+    session = await engine.initialize_session(request.candidate_id)
     return {
         "session_id": session.id,
         "candidate_id": session.candidate_id,
@@ -29,23 +37,20 @@ def start_session(request: schemas.SessionCreate, db: Session = Depends(get_db))
     }
 
 @router.get("/sessions/{session_id}/next_item", response_model=Optional[schemas.QuestionResponse])
-def get_next_item(session_id: int, db: Session = Depends(get_db)):
+async def get_next_item(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Submit already returns the next item; this is for the first item and resumes
     engine = PsychometricEngine(db)
-    item = engine.get_next_item(session_id)
+    item = await engine.get_next_item(session_id)
     
     if not item:
         return None # Test finished
         
-    return {
-        "id": item.id,
-        "text": item.text,
-        "trait": item.trait
-    }
+    return _question(item)
 
 @router.post("/sessions/submit", response_model=schemas.SubmitAnswerResponse)
-def submit_answer(request: schemas.SubmitAnswerRequest, db: Session = Depends(get_db)):
+async def submit_answer(request: schemas.SubmitAnswerRequest, db: AsyncSession = Depends(get_async_db)):
     engine = PsychometricEngine(db)
-    success = engine.submit_response(
+    success, next_item = await engine.submit_and_get_next(
         request.session_id, 
         request.item_id, 
         request.value, 
@@ -55,4 +60,35 @@ def submit_answer(request: schemas.SubmitAnswerRequest, db: Session = Depends(ge
     if not success:
         raise HTTPException(status_code=400, detail="Invalid session or item")
         
-    return {"success": True}
+    return {
+        "success": True,
+        "next_item_id": next_item.id if next_item else None,
+        "next_item": _question(next_item) if next_item else None
+    }
+
+@router.post("/sessions/{session_id}/submit/batch", response_model=schemas.SubmitBatchResponse)
+async def submit_answers_batch(session_id: int, request: schemas.SubmitBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    # For clients that buffer answers offline and flush them in one go
+    engine = PsychometricEngine(db)
+    result = await engine.submit_batch(session_id, [a.model_dump() for a in request.answers])
+
+    if "error" in result:
+        status = {"Session not found": 404, "Session is being updated concurrently": 409}.get(result["error"], 400)
+        raise HTTPException(status_code=status, detail=result["error"])
+
+    next_item = result["next_item"]
+    return {
+        "success": True,
+        "saved": result["saved"],
+        "skipped_item_ids": result["skipped_item_ids"],
+        "next_item_id": next_item.id if next_item else None,
+        "next_item": _question(next_item) if next_item else None
+    }
+
+@router.post("/items/reload")
+async def reload_item_bank(db: AsyncSession = Depends(get_async_db)):
+    # Call after editing psych_items outside the API (e.g. SQL scripts).
+    # Reloads this worker now; the others reload within ITEM_BANK_TTL_SECONDS.
+    invalidate_item_bank()
+    bank = await get_item_bank_async(db)
+    return {"version": bank.version, "items": len(bank), "other_workers_within_seconds": ITEM_BANK_TTL_SECONDS}
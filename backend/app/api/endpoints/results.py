@@ -1,78 +1,165 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import TestSession, ItemResponse, CandidateProfile, PsychometricItem
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+from app.database import get_async_db
+from app.models import TestSession, ItemResponse, CandidateProfile
+from app.engines.item_bank import get_item_bank_async
+from app.engines.irt import get_scorer, theta_to_percentile, N_CATEGORIES
+from app.engines.psychometric import PsychometricEngine
+from app.admission import admission
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List
+import numpy as np
 
 router = APIRouter()
 
+# Reported Big Five score -> trait name(s) it has in the item bank. The
+# IPIP-50 bank (ipip50.json) spells it "Extroversion"; the SQL seeds use
+# "Extraversion".
+BIG_FIVE = {
+    "Openness": ("Openness",),
+    "Conscientiousness": ("Conscientiousness",),
+    "Extraversion": ("Extraversion", "Extroversion"),
+    "Agreeableness": ("Agreeableness",),
+    "Neuroticism": ("Neuroticism",),
+}
+
 class ProfileRequest(BaseModel):
     session_id: int
     cognitive_score: int
     language_analysis: Dict[str, Any]
 
-@router.post("/generate")
-def generate_profile(request: ProfileRequest, db: Session = Depends(get_db)):
-    # 1. Get Session
-    session = db.query(TestSession).filter(TestSession.id == request.session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    # 2. Calculate Psychometric Scores (Big 5)
-    # Fetch all responses
-    responses = db.query(ItemResponse).filter(ItemResponse.session_id == request.session_id).all()
-    
-    scores = {
-        "Openness": [],
-        "Conscientiousness": [],
-        "Extraversion": [],
-        "Agreeableness": [],
-        "Neuroticism": []
+class BatchProfileRequest(BaseModel):
+    profiles: List[ProfileRequest]
+
+async def compute_psych_scores(db: AsyncSession, session_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    """
+    Big Five scores (0-100) for many sessions from a single responses query.
+    All sessions are scored in one batched GRM posterior (engines/irt.py);
+    a score is the population percentile of the trait's theta.
+    """
+    bank = await get_item_bank_async(db)
+    session_ids = list(dict.fromkeys(session_ids))
+    n_sessions, n_traits = len(session_ids), len(bank.traits)
+
+    rows = []
+    if session_ids:
+        rows = (await db.execute(
+            select(ItemResponse.session_id, ItemResponse.item_id, ItemResponse.response_value)
+            .where(ItemResponse.session_id.in_(session_ids))
+        )).all()
+
+    session_pos = {sid: n for n, sid in enumerate(session_ids)}
+    row_of = bank.row_of
+    valid = [
+        (session_pos[s], row_of[i], v)
+        for s, i, v in rows
+        if i in row_of and v is not None
+    ]
+    if valid:
+        s_idx, item_rows, values = (np.array(col) for col in zip(*valid))
+    else:
+        s_idx = item_rows = values = np.zeros(0, dtype=np.intp)
+    values = np.where(bank.reverse_keyed[item_rows], 6 - values, values)
+    categories = np.clip(values, 1, N_CATEGORIES) - 1
+
+    group = s_idx * n_traits + bank.trait_index[item_rows]
+    theta, _ = get_scorer(bank).score_batch(group, item_rows, categories, n_sessions * n_traits)
+    # Traits without answers keep the prior mean -> 50
+    normalized = np.round(theta_to_percentile(theta)).astype(int).reshape(n_sessions, n_traits)
+
+    # Big Five score -> bank trait column (validity scales etc. are not reported)
+    trait_pos = {t: n for n, t in enumerate(bank.traits)}
+    columns = {}
+    for trait, names in BIG_FIVE.items():
+        found = [trait_pos[name] for name in names if name in trait_pos]
+        if not found:
+            raise HTTPException(status_code=500, detail=f"Item bank has no items for {trait} (looked for {', '.join(names)})")
+        columns[trait] = found[0]
+    return {
+        sid: {trait: int(normalized[n, col]) for trait, col in columns.items()}
+        for sid, n in session_pos.items()
     }
-    
-    for r in responses:
-        item = db.query(PsychometricItem).filter(PsychometricItem.id == r.item_id).first()
-        if item and item.trait in scores:
-            val = r.response_value
-            if item.keyed == "minus":
-                val = 6 - val
-            scores[item.trait].append(val)
-            
-    # Average and Normalize (0-100)
-    final_psych_scores = {}
-    for trait, values in scores.items():
-        if values:
-            avg = sum(values) / len(values)
-            # Map 1-5 to 0-100
-            # 1=0, 5=100 -> (val-1)*25
-            final_psych_scores[trait] = round((avg - 1) * 25)
-        else:
-            final_psych_scores[trait] = 50 # Default
-            
-    # 3. Combine Scores
+
+def _build_profile(session: TestSession, psych_scores: Dict[str, int], request: ProfileRequest):
+    # Combine Scores
     final_scores = {
-        **final_psych_scores,
+        **psych_scores,
         "Logic_Reasoning": request.cognitive_score * 10, # Assuming score is 0-10, map to 0-100
         "English_Level": request.language_analysis.get("analysis", {}).get("estimated_cefr", "B1")
     }
-    
-    # 4. Save Profile
     profile = CandidateProfile(
         candidate_id=session.candidate_id,
         session_id=session.id,
         scores=final_scores
     )
+    # Update Session Status (re-scoring an old session keeps its completion time)
+    if session.status != "completed":
+        session.status = "completed"
+        session.end_time = func.now()
+    return profile
+
+@router.post("/generate", dependencies=[admission("profiles")])
+async def generate_profile(request: ProfileRequest, db: AsyncSession = Depends(get_async_db)):
+    # 1. Get Session (writing any answers still buffered in the session store)
+    engine = PsychometricEngine(db)
+    await engine.flush(request.session_id)
+    session = await db.get(TestSession, request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    # 2. Calculate Psychometric Scores (Big 5)
+    psych_scores = (await compute_psych_scores(db, [session.id]))[session.id]
+
+    # 3. Save Profile
+    profile = _build_profile(session, psych_scores, request)
     db.add(profile)
-    
-    # Update Session Status
-    session.status = "completed"
-    session.end_time = "now()" # SQLAlchemy will handle timestamp if configured, or use datetime.now()
-    
-    db.commit()
-    db.refresh(profile)
-    
+    await db.commit()
+    await engine.close_session(session.id)
+
     return {
         "profile_id": profile.id,
-        "scores": final_scores
+        "scores": profile.scores
+    }
+
+@router.post("/generate/batch", dependencies=[admission("profiles")])
+async def generate_profiles_batch(request: BatchProfileRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Scores many sessions at once (e.g. re-scoring after a scoring change):
+    one sessions query, one responses query and a single commit.
+    """
+    session_ids = [p.session_id for p in request.profiles]
+    engine = PsychometricEngine(db)
+    for session_id in set(session_ids):
+        await engine.flush(session_id)
+    sessions = {}
+    if session_ids:
+        result = await db.execute(select(TestSession).where(TestSession.id.in_(session_ids)))
+        sessions = {s.id: s for s in result.scalars()}
+    psych_scores = await compute_psych_scores(db, list(sessions))
+
+    created = []
+    missing = []
+    for p in request.profiles:
+        session = sessions.get(p.session_id)
+        if not session:
+            missing.append(p.session_id)
+            continue
+        profile = _build_profile(session, psych_scores[session.id], p)
+        db.add(profile)
+        created.append(profile)
+
+    await db.flush() # Assigns profile ids in batched inserts
+    results = [
+        {"session_id": profile.session_id, "profile_id": profile.id, "scores": profile.scores}
+        for profile in created
+    ]
+    await db.commit()
+    for profile in created:
+        await engine.close_session(profile.session_id)
+
+    return {
+        "profiles": results,
+        "missing_sessions": missing
     }
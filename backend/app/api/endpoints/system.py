@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from app.database import pool_status
+from app import pooling
+from app.admission import admission_stats
+from app.engines.session_store import session_store_stats
+from app.engines.transcription import transcription_service
+from app.startup import startup_report, warmup, WARMUP_TARGETS
+
+router = APIRouter()
+
+@router.get("/db/pool")
+def db_pool():
+    return {
+        "config": {
+            "pool_size": pooling.DB_POOL_SIZE,
+            "max_overflow": pooling.DB_MAX_OVERFLOW,
+            "pool_timeout": pooling.DB_POOL_TIMEOUT,
+            "pool_recycle": pooling.DB_POOL_RECYCLE,
+            "pre_ping": pooling.DB_POOL_PRE_PING,
+            "statement_timeout_ms": pooling.DB_STATEMENT_TIMEOUT_MS,
+            "pgbouncer_mode": pooling.DB_PGBOUNCER,
+        },
+        "pools": pool_status(),
+    }
+
+@router.get("/transcription")
+def transcription_queue():
+    return transcription_service.stats()
+
+@router.get("/admission")
+def admission_queues():
+    """Per route class: slots in use, queue depth and rejections (this worker)."""
+    return admission_stats()
+
+@router.get("/sessions")
+def session_store():
+    """Write-behind session store: active sessions and answers not yet in the DB."""
+    return session_store_stats()
+
+@router.get("/startup")
+def startup_times():
+    """Time spent on each import/model load in this worker process."""
+    return startup_report.as_dict()
+
+@router.post("/warmup")
+async def warmup_models(targets: str = Query(",".join(WARMUP_TARGETS), description="Comma-separated: " + ", ".join(WARMUP_TARGETS))):
+    names = [t.strip() for t in targets.split(",") if t.strip()]
+    loaded = await run_in_threadpool(warmup, names)
+    return {"loaded": loaded}
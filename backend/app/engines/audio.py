@@ -0,0 +1,272 @@
+import asyncio
+import os
+from typing import List, Tuple
+import numpy as np
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Uploads are decoded by piping the bytes through ffmpeg straight into a
+# 16 kHz mono float32 array (the format Whisper works on). The multipart body
+# is parsed from the raw request stream rather than through UploadFile: by
+# the time an UploadFile is handed over, Starlette has received the whole
+# body and spooled anything over 1 MB to a temp file. This way the size limit
+# applies while the upload arrives and nothing is written to disk.
+
+SAMPLE_RATE = 16000 # whisper.audio.SAMPLE_RATE
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(25 * 1024 * 1024)))
+MAX_AUDIO_SECONDS = int(os.getenv("MAX_AUDIO_SECONDS", "300"))
+
+CHUNK_SIZE = 64 * 1024
+MULTIPART_OVERHEAD = 64 * 1024 # boundaries, part headers and small form fields
+
+class AudioError(Exception):
+    pass
+
+class AudioTooLarge(AudioError):
+    pass
+
+class AudioDecodeError(AudioError):
+    pass
+
+class AudioUploadError(AudioError):
+    """The request is not a multipart upload with an audio file field."""
+
+async def decode_audio_stream(read, max_bytes: int = MAX_AUDIO_BYTES, max_seconds: int = MAX_AUDIO_SECONDS) -> np.ndarray:
+    """
+    Decodes an encoded audio stream to float32 samples in [-1, 1].
+    `read(n)` is an async callable returning the next chunk (b"" at the end),
+    e.g. the file part of a request in decode_request. Limits are enforced
+    while streaming.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-threads", "0",
+            "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise AudioDecodeError("FFmpeg is not installed")
+
+    max_pcm_bytes = max_seconds * SAMPLE_RATE * 2
+
+    async def feed():
+        received = 0
+        try:
+            while True:
+                chunk = await read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > max_bytes:
+                    raise AudioTooLarge(f"Audio upload exceeds {max_bytes} bytes")
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # ffmpeg gave up; its exit code tells us why
+        finally:
+            proc.stdin.close()
+
+    async def collect():
+        pcm = bytearray()
+        while True:
+            chunk = await proc.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                return pcm
+            pcm += chunk
+            if len(pcm) > max_pcm_bytes:
+                raise AudioTooLarge(f"Audio is longer than {max_seconds} seconds")
+
+    async def drain_stderr():
+        # ffmpeg logs a lot; keep only the tail for error messages
+        tail = b""
+        while True:
+            chunk = await proc.stderr.read(CHUNK_SIZE)
+            if not chunk:
+                return tail
+            tail = (tail + chunk)[-2000:]
+
+    try:
+        _, pcm, stderr = await asyncio.gather(feed(), collect(), drain_stderr())
+        returncode = await proc.wait()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+    if returncode != 0:
+        raise AudioDecodeError(f"FFmpeg failed to decode audio: {stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(bytes(pcm), np.int16).astype(np.float32) / 32768.0
+
+async def decode_request(request, field: str = "file", max_bytes: int = MAX_AUDIO_BYTES) -> np.ndarray:
+    """
+    Decodes the `field` file of a multipart/form-data request as it is
+    received: the body is read from request.stream() and the file part's
+    bytes are fed to ffmpeg chunk by chunk.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise AudioUploadError("Expected a multipart/form-data upload")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise AudioTooLarge(f"Audio upload exceeds {max_bytes} bytes")
+
+    pending = bytearray()
+    part = {"header": b"", "value": b"", "disposition": b"", "is_file": False, "found": False, "done": False}
+
+    def on_header_field(data, start, end):
+        part["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            part["disposition"] = part["value"]
+        part["header"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["disposition"])
+        part["is_file"] = not part["found"] and options.get(b"name") == field.encode()
+        part["found"] = part["found"] or part["is_file"]
+        part["disposition"] = b""
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            pending.extend(data[start:end])
+
+    def on_part_end():
+        if part["is_file"]:
+            part["is_file"], part["done"] = False, True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    body = request.stream().__aiter__()
+    received = 0
+
+    async def read(_size):
+        nonlocal received
+        while not pending and not part["done"]:
+            try:
+                chunk = await body.__anext__()
+            except StopAsyncIteration:
+                if not part["found"]:
+                    raise AudioUploadError(f"No '{field}' file in the upload")
+                break
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD:
+                raise AudioTooLarge(f"Audio upload exceeds {max_bytes} bytes")
+            parser.write(chunk)
+        data = bytes(pending)
+        pending.clear()
+        return data
+
+    return await decode_audio_stream(read, max_bytes)
+
+
+# --- Voice activity detection ---
+# Candidate recordings are mostly silence (thinking time, trailing silence
+# before stop). A simple frame-energy detector is enough to cut it out.
+
+VAD_FRAME_MS = 30
+VAD_MIN_SILENCE_S = 0.6 # shorter pauses stay inside a speech region
+VAD_MIN_SPEECH_S = 0.25 # shorter blips (clicks, breaths) are dropped
+VAD_PAD_S = 0.2 # kept around each region so word edges are not clipped
+VAD_FLOOR_DBFS = -45.0 # never call anything quieter than this speech
+VAD_NOISE_MARGIN_DB = 12.0 # speech must be this much above the noise floor
+VAD_SPEECH_RANGE_DB = 20.0 # ...but never more than this below the loud frames
+
+MAX_CHUNK_SECONDS = 30 # Whisper's decoding window
+
+def speech_regions(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges that contain speech, in order."""
+    frame = int(sample_rate * VAD_FRAME_MS / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    # The 10th percentile estimates the noise floor, unless nearly the whole
+    # recording is speech; the 90th percentile bounds it from above then.
+    p10, p90 = np.percentile(db, [10, 90])
+    threshold = max(VAD_FLOOR_DBFS, min(p10 + VAD_NOISE_MARGIN_DB, p90 - VAD_SPEECH_RANGE_DB))
+    voiced = db > threshold
+
+    # Runs of voiced frames as [start, end) frame indices
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    min_gap = VAD_MIN_SILENCE_S * 1000 / VAD_FRAME_MS
+    merged = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if merged and s - merged[-1][1] < min_gap:
+            merged[-1][1] = e
+        else:
+            merged.append([s, e])
+
+    pad = int(VAD_PAD_S * sample_rate)
+    regions = []
+    for s, e in merged:
+        if (e - s) * frame < VAD_MIN_SPEECH_S * sample_rate:
+            continue
+        start, end = max(0, s * frame - pad), min(len(audio), e * frame + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end) # Padding made them touch
+        else:
+            regions.append((start, end))
+    return regions
+
+def _quietest_point(audio: np.ndarray, lo: int, hi: int, sample_rate: int) -> int:
+    """Start of the lowest-energy frame in [lo, hi), to avoid cutting a word."""
+    frame = int(sample_rate * VAD_FRAME_MS / 1000)
+    n_frames = (hi - lo) // frame
+    frames = audio[lo:lo + n_frames * frame].reshape(n_frames, frame).astype(np.float64)
+    return lo + int(np.argmin((frames ** 2).mean(axis=1))) * frame
+
+def speech_chunks(audio: np.ndarray, regions: List[Tuple[int, int]], sample_rate: int = SAMPLE_RATE,
+                  max_seconds: int = MAX_CHUNK_SECONDS) -> List[np.ndarray]:
+    """
+    Packs consecutive speech regions (silence between them removed) into
+    chunks of at most `max_seconds`, splitting longer regions, so each chunk
+    is one Whisper window and chunks can be transcribed independently.
+    """
+    limit = max_seconds * sample_rate
+    pieces = []
+    for start, end in regions:
+        while end - start > limit:
+            cut = _quietest_point(audio, start + limit - 5 * sample_rate, start + limit, sample_rate)
+            pieces.append(audio[start:cut])
+            start = cut
+        pieces.append(audio[start:end])
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        if current and size + len(piece) > limit:
+            chunks.append(np.concatenate(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece)
+    if current:
+        chunks.append(np.concatenate(current))
+    return chunks
+
+def split_speech(audio: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """
+    Drops silence: returns the speech chunks (each at most one Whisper
+    window) plus speaking and total duration in seconds.
+    """
+    regions = speech_regions(audio, sample_rate)
+    chunks = speech_chunks(audio, regions, sample_rate)
+    speaking_seconds = sum(end - start for start, end in regions) / sample_rate
+    return chunks, speaking_seconds, len(audio) / sample_rate
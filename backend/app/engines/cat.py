@@ -0,0 +1,139 @@
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+import numpy as np
+from app.engines.item_bank import ItemBank, BankItem
+
+# Computerized Adaptive Testing (CAT) item selection.
+# Items are scored with the 2PL Fisher information at the session's current
+# theta for the item's trait:
+#   P(theta) = 1 / (1 + exp(-a * (theta - b)))
+#   I(theta) = a^2 * P * (1 - P)
+# A trait's standard error is 1 / sqrt(1 + sum of I over its answered items)
+# (the 1 is the N(0, 1) prior), which drives the stopping rule below unless
+# the caller passes posterior SEs (the psychometric engine does, engines/irt.py).
+
+
+def fisher_information(a: np.ndarray, b: np.ndarray, theta: np.ndarray) -> np.ndarray:
+    p = 1.0 / (1.0 + np.exp(-a * (theta - b)))
+    return a * a * p * (1.0 - p)
+
+
+@dataclass(frozen=True)
+class StoppingRule:
+    """
+    When a CAT session is finished. A trait stays open until its SE is at or
+    below se_target and it has min_items_per_trait answers; the test ends
+    when no trait is open (and min_items were served) or at max_items.
+    Content balance: the next item comes from the open traits with the
+    fewest answers (within balance_slack items of each other).
+    """
+    se_target: float = 0.6 # 0 = measure every trait until its items run out
+    min_items: int = 0
+    max_items: int = 0 # 0 = no limit
+    min_items_per_trait: int = 3
+    balance_slack: int = 1
+
+    @classmethod
+    def from_env(cls) -> "StoppingRule":
+        return cls(
+            se_target=float(os.getenv("CAT_SE_TARGET", "0.6")),
+            min_items=int(os.getenv("CAT_MIN_ITEMS", "0")),
+            max_items=int(os.getenv("CAT_MAX_ITEMS", "0")),
+            min_items_per_trait=int(os.getenv("CAT_MIN_ITEMS_PER_TRAIT", "3")),
+            balance_slack=int(os.getenv("CAT_BALANCE_SLACK", "1")),
+        )
+
+
+class FisherItemSelector:
+    """
+    Maximum-information item selection with randomesque exposure control:
+    instead of always serving the single most informative item, we pick at
+    random among the `top_k` best, so calibrated "star" items don't get
+    shown to every candidate. With a `stopping` rule the test ends once
+    every trait is measured precisely enough; without one it runs until the
+    bank is exhausted.
+    """
+
+    def __init__(self, top_k: int = 5, validity_rate: float = 0.2, rng: Optional[random.Random] = None,
+                 stopping: Optional[StoppingRule] = None):
+        self.top_k = top_k
+        self.validity_rate = validity_rate
+        self.rng = rng or random.Random()
+        self.stopping = stopping
+
+    def eligible_mask(self, bank: ItemBank, answered_ids: Iterable[int]) -> np.ndarray:
+        mask = np.ones(len(bank), dtype=bool)
+        mask[bank.rows(answered_ids)] = False
+        return mask
+
+    def item_information(self, bank: ItemBank, theta: Dict[str, float]) -> np.ndarray:
+        trait_theta = np.array([theta.get(t, 0.0) for t in bank.traits], dtype=np.float64)
+        return fisher_information(bank.a, bank.b, trait_theta[bank.trait_index])
+
+    def trait_standard_errors(self, bank: ItemBank, theta: Dict[str, float], answered_rows: np.ndarray) -> np.ndarray:
+        """SE of theta per bank trait (bank.traits order) from the answered items."""
+        info = self.item_information(bank, theta)[answered_rows]
+        test_info = np.bincount(bank.trait_index[answered_rows], weights=info, minlength=len(bank.traits))
+        return 1.0 / np.sqrt(1.0 + test_info)
+
+    def open_traits(self, bank: ItemBank, theta: Dict[str, float], answered_rows: np.ndarray,
+                    trait_eligible: np.ndarray, rule: StoppingRule,
+                    trait_se: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Per bank trait: may the next item come from it (see StoppingRule)."""
+        n_traits = len(bank.traits)
+        counts = np.bincount(bank.trait_index[answered_rows], minlength=n_traits)
+        has_items = np.bincount(bank.trait_index[trait_eligible], minlength=n_traits) > 0
+        if trait_se is None:
+            se = self.trait_standard_errors(bank, theta, answered_rows)
+        else:
+            se = np.array([trait_se.get(t, np.inf) for t in bank.traits])
+
+        is_open = has_items & ((se > rule.se_target) | (counts < rule.min_items_per_trait))
+        if not is_open.any() and len(answered_rows) < rule.min_items:
+            is_open = has_items # Precise enough, but keep going to the minimum length
+        if is_open.any():
+            is_open &= counts <= counts[is_open].min() + rule.balance_slack
+        return is_open
+
+    def select(self, bank: ItemBank, theta: Dict[str, float], answered_ids: Iterable[int],
+               stopping: Optional[StoppingRule] = None,
+               trait_se: Optional[Dict[str, float]] = None) -> Optional[BankItem]:
+        """
+        The next item, or None when the test is finished. `stopping`
+        overrides the selector's rule; `trait_se` overrides the 2PL standard
+        errors (e.g. posterior SEs from a scoring model).
+        """
+        answered_ids = list(answered_ids)
+        eligible = self.eligible_mask(bank, answered_ids)
+        if not eligible.any():
+            return None # Test finished
+
+        trait_eligible = eligible & ~bank.is_validity
+        rule = stopping or self.stopping
+        if rule:
+            answered_rows = bank.rows(answered_ids)
+            if rule.max_items and len(answered_rows) >= rule.max_items:
+                return None
+            is_open = self.open_traits(bank, theta, answered_rows, trait_eligible, rule, trait_se)
+            trait_eligible &= is_open[bank.trait_index]
+
+        # We prioritize Validity Checks if they haven't appeared
+        # (validity_rate chance to insert a trap, default 20%).
+        # Once every trait is done, the remaining ones are served before stopping.
+        validity = eligible & bank.is_validity
+        if validity.any() and (not trait_eligible.any() or self.rng.random() < self.validity_rate):
+            return bank.items[self.rng.choice(np.flatnonzero(validity))]
+        if not trait_eligible.any():
+            return None # Every trait measured precisely enough
+
+        info = self.item_information(bank, theta)
+        info[~trait_eligible] = -np.inf
+
+        # Randomesque: everything at least as informative as the k-th best
+        # (ties included, so an uncalibrated bank degrades to random order)
+        k = min(self.top_k, int(trait_eligible.sum()))
+        kth = np.partition(info, -k)[-k]
+        candidates = np.flatnonzero(info >= kth)
+        return bank.items[self.rng.choice(candidates)]
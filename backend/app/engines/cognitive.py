@@ -1,83 +1,130 @@
 import random
 import json
 
+# Difficulty levels understood by the generators
+DIFFICULTIES = (1, 2, 3)
+
+def clamp_difficulty(difficulty: int) -> int:
+    return min(max(int(difficulty), DIFFICULTIES[0]), DIFFICULTIES[-1])
+
 class CognitiveEngine:
-    def generate_abstract_matrix(self, difficulty: int):
+    """
+    Puzzle generators. Each takes an optional `rng` (random.Random) so that
+    the same seed always produces the same puzzle; without one they use the
+    module-level random generator as before.
+    """
+
+    def generate_abstract_matrix(self, difficulty: int, rng=None):
         """
         Generates a 3x3 Raven's Matrix puzzle.
         Returns a JSON structure defining the shapes and the rule.
+        1: one rule along the row, 2: finer steps that also shift per row,
+        3: rotation and count progression combined, near-miss distractors.
         """
+        rng = rng or random
+        difficulty = clamp_difficulty(difficulty)
         # Simplified Logic:
         # Rule types: Rotation, Addition, Subtraction
-        rules = ["rotation", "progression"]
-        rule = random.choice(rules)
-        
+        rules = ["rotation", "progression"] if difficulty < 3 else ["rotation_progression"]
+        rule = rng.choice(rules)
+
         matrix = []
         correct_answer = None
         distractors = []
-        
+
         if rule == "rotation":
-            # Shape rotates 90 degrees clockwise across the row
-            base_shape = random.choice(["square", "triangle", "circle", "star"])
-            start_angle = random.choice([0, 45, 90])
-            
+            # Shape rotates clockwise across the row (and, from level 2, down the column)
+            base_shape = rng.choice(["square", "triangle", "circle", "star"])
+            start_angle = rng.choice([0, 45, 90])
+            col_step, row_step = (90, 0) if difficulty == 1 else (45, 90)
+
             for row in range(3):
                 row_data = []
                 for col in range(3):
-                    angle = (start_angle + (col * 90) + (row * 0)) % 360
+                    angle = (start_angle + (col * col_step) + (row * row_step)) % 360
                     cell = {"shape": base_shape, "angle": angle, "color": "black", "marker": True}
                     row_data.append(cell)
                 matrix.append(row_data)
-            
+
             # The missing piece is the last one (2,2)
             correct_answer = matrix[2][2]
             matrix[2][2] = None # Hide it
-            
+
             # Generate unique distractors
             possible_angles = [0, 45, 90, 135, 180, 225, 270, 315]
             # Remove correct angle to avoid duplicates
             if correct_answer["angle"] in possible_angles:
                 possible_angles.remove(correct_answer["angle"])
-            
+
             # Shuffle and pick 3 unique angles
-            random.shuffle(possible_angles)
+            rng.shuffle(possible_angles)
             selected_angles = possible_angles[:3]
-            
+
             for angle in selected_angles:
                 distractors.append({
-                    "shape": base_shape, 
-                    "angle": angle, 
+                    "shape": base_shape,
+                    "angle": angle,
                     "color": "black",
                     "marker": True
                 })
-                
+
         elif rule == "progression":
             # Number of sides or items increases
-            base_count = random.randint(1, 3)
-            
+            base_count = rng.randint(1, 3)
+            step = 1 if difficulty == 1 else rng.choice([2, 3])
+
             for row in range(3):
                 row_data = []
                 for col in range(3):
-                    count = base_count + col + row
+                    count = base_count + (col + row) * step
                     cell = {"shape": "dot", "count": count, "color": "blue"}
                     row_data.append(cell)
                 matrix.append(row_data)
-                
+
             correct_answer = matrix[2][2]
             matrix[2][2] = None
-            
+
             # Generate unique distractors (different counts)
             correct_count = correct_answer["count"]
-            possible_counts = [c for c in range(1, 13) if c != correct_count]
-            random.shuffle(possible_counts)
-            
+            possible_counts = [c for c in range(1, max(13, correct_count + 4)) if c != correct_count]
+            rng.shuffle(possible_counts)
+
             for count in possible_counts[:3]:
                 distractors.append({
-                    "shape": "dot", 
-                    "count": count, 
+                    "shape": "dot",
+                    "count": count,
                     "color": "blue"
                 })
 
+        elif rule == "rotation_progression":
+            # Shape rotates along the row while the count grows down the column
+            base_shape = rng.choice(["square", "triangle", "star"])
+            start_angle = rng.choice([0, 45, 90])
+            base_count = rng.randint(1, 3)
+
+            for row in range(3):
+                row_data = []
+                for col in range(3):
+                    cell = {
+                        "shape": base_shape,
+                        "angle": (start_angle + col * 90) % 360,
+                        "count": base_count + row,
+                        "color": "black",
+                        "marker": True
+                    }
+                    row_data.append(cell)
+                matrix.append(row_data)
+
+            correct_answer = matrix[2][2]
+            matrix[2][2] = None
+
+            # Near misses: right angle/wrong count, right count/wrong angle, both wrong
+            angle, count = correct_answer["angle"], correct_answer["count"]
+            wrong_angles = [a for a in (0, 45, 90, 135, 180, 225, 270, 315) if a != angle]
+            rng.shuffle(wrong_angles)
+            for a, c in ((angle, count + rng.choice([-1, 1])), (wrong_angles[0], count), (wrong_angles[1], count + 1)):
+                distractors.append({**correct_answer, "angle": a, "count": c})
+
         return {
             "type": "abstract",
             "rule": rule,
@@ -86,59 +133,86 @@ class CognitiveEngine:
             "correct_index": 0 # We shuffle later
         }
 
-    def generate_numerical_series(self, difficulty: int):
+    def generate_numerical_series(self, difficulty: int, rng=None):
         """
         Generates a number series puzzle.
         e.g. 2, 4, 8, 16, ?
+        1: constant addition, 2: addition or multiplication,
+        3: second-order series (the step itself grows).
         """
-        start = random.randint(1, 50)
-        step = random.randint(2, 10)
-        operator = random.choice(["add", "multiply"])
-        
+        rng = rng or random
+        difficulty = clamp_difficulty(difficulty)
+        start = rng.randint(1, 50)
+        step = rng.randint(2, 10)
+        if difficulty == 1:
+            operator = "add"
+        elif difficulty == 2:
+            operator = rng.choice(["add", "multiply"])
+            if operator == "multiply":
+                start, step = rng.randint(1, 9), rng.randint(2, 4) # Keep numbers readable
+        else:
+            operator = "add_growing"
+        growth = rng.randint(1, 4)
+
         series = []
         current = start
         for _ in range(5):
             series.append(current)
             if operator == "add":
                 current += step
-            else:
+            elif operator == "multiply":
                 current *= step
-                
+            else:
+                current += step
+                step += growth
+
         correct_answer = series[-1]
         series[-1] = "?" # Hide last
-        
+
         # Generate unique distractors
+        # Harder levels use closer (and "logic error") distractors
+        max_offset = 5 if difficulty == 1 else 3
         distractors = set()
+        if difficulty == 3:
+            distractors.add(series[-2] + (series[-2] - series[-3])) # Forgot the step grows
         while len(distractors) < 3:
-            offset = random.choice([-1, 1]) * random.randint(1, 5)
+            offset = rng.choice([-1, 1]) * rng.randint(1, max_offset)
             # Or sometimes a "logic error" distractor (e.g. step + 1)
             fake_answer = correct_answer + offset
             if fake_answer != correct_answer and fake_answer > 0:
                 distractors.add(fake_answer)
-        
+
         return {
             "type": "numerical",
             "series": series,
-            "options": [correct_answer] + list(distractors),
+            "options": [correct_answer] + sorted(distractors),
             "correct_index": 0
         }
 
-    def generate_verbal_syllogism(self, difficulty: int):
+    def generate_verbal_syllogism(self, difficulty: int, rng=None):
         """
         Generates a syllogism.
         All A are B. Some C are A. Therefore...
+        1-2: valid syllogism (2 with a tempting over-generalization),
+        3: invalid syllogism (undistributed middle), nothing follows.
         """
+        rng = rng or random
+        difficulty = clamp_difficulty(difficulty)
         # Templates
+        # (Plural, Singular)
         subjects = [
-            "Gerentes", "Programadores", "Vendedores", "Líderes", 
-            "Diseñadores", "Ingenieros", "Contadores", "Analistas", 
-            "Directores", "Consultores", "Arquitectos", "Científicos"
+            ("Gerentes", "Gerente"), ("Programadores", "Programador"),
+            ("Vendedores", "Vendedor"), ("Líderes", "Líder"),
+            ("Diseñadores", "Diseñador"), ("Ingenieros", "Ingeniero"),
+            ("Contadores", "Contador"), ("Analistas", "Analista"),
+            ("Directores", "Director"), ("Consultores", "Consultor"),
+            ("Arquitectos", "Arquitecto"), ("Científicos", "Científico")
         ]
         # (Plural, Singular) for grammar agreement
         attributes = [
-            ("Productivos", "Productivo"), 
-            ("Creativos", "Creativo"), 
-            ("Analíticos", "Analítico"), 
+            ("Productivos", "Productivo"),
+            ("Creativos", "Creativo"),
+            ("Analíticos", "Analítico"),
             ("Estratégicos", "Estratégico"),
             ("Innovadores", "Innovador"),
             ("Eficientes", "Eficiente"),
@@ -149,15 +223,15 @@ class CognitiveEngine:
             ("Pragmáticos", "Pragmático"),
             ("Meticulosos", "Meticuloso")
         ]
-        
-        s = random.choice(subjects)
-        a_pair = random.choice(attributes)
+
+        s, s_singular = rng.choice(subjects)
+        a_pair = rng.choice(attributes)
         a_plural = a_pair[0]
         a_singular = a_pair[1]
-        
+
         # Premise 1: All S are A
         p1 = f"Todos los {s} son {a_plural}."
-        
+
         # Premise 2: Some X are S
         x_options = [
             ("Nuevos Empleados", "Nuevo Empleado"),
@@ -165,23 +239,36 @@ class CognitiveEngine:
             ("Candidatos", "Candidato"),
             ("Supervisores", "Supervisor")
         ]
-        x_pair = random.choice(x_options)
+        x_pair = rng.choice(x_options)
         x_plural = x_pair[0]
         x_singular = x_pair[1]
 
-        p2 = f"Algunos {x_plural} son {s}."
-        
-        # Conclusion: Some X are A (Valid)
-        conclusion = f"Algunos {x_plural} son {a_plural}."
-        
-        return {
-            "type": "verbal",
-            "text": f"{p1} {p2} Por lo tanto...",
-            "options": [
+        if difficulty < 3:
+            p2 = f"Algunos {x_plural} son {s}."
+
+            # Conclusion: Some X are A (Valid)
+            conclusion = f"Algunos {x_plural} son {a_plural}."
+            options = [
                 conclusion,
                 f"Ningún {x_singular} es {a_singular}.",
-                f"Todos los {x_plural} son {a_plural}.",
+                f"Todos los {x_plural} son {a_plural}." if difficulty == 1 else f"Todos los {x_plural} son {s}.",
                 "Ninguna de las anteriores."
-            ],
-            "correct_index": 0
+            ]
+            correct_index = 0
+        else:
+            # Premise 2: Some X are A -> says nothing about X being S
+            p2 = f"Algunos {x_plural} son {a_plural}."
+            options = [
+                f"Algunos {x_plural} son {s}.",
+                f"Ningún {x_singular} es {s_singular}.",
+                f"Todos los {x_plural} son {s}.",
+                "Ninguna de las anteriores."
+            ]
+            correct_index = 3
+
+        return {
+            "type": "verbal",
+            "text": f"{p1} {p2} Por lo tanto...",
+            "options": options,
+            "correct_index": correct_index
         }
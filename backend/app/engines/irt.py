@@ -0,0 +1,119 @@
+import math
+import os
+from typing import Iterable, Optional, Tuple
+import numpy as np
+from app.engines.item_bank import ItemBank
+
+# Trait scoring with the graded response model (GRM).
+# Likert answers (1-5, after reverse keying) are categories 0-4. For an item
+# with discrimination a and category thresholds b_1 < ... < b_4:
+#   P(X >= k | theta) = 1 / (1 + exp(-a * (theta - b_k)))
+#   P(X = k | theta)  = P(X >= k) - P(X >= k + 1)
+# The posterior over theta is evaluated on a fixed quadrature grid with a
+# N(0, 1) prior, so scoring is table lookups and sums: log P(X = k | grid)
+# is precomputed for every item and category when the bank is loaded.
+
+N_CATEGORIES = 5
+QUAD_POINTS = np.linspace(-4.0, 4.0, 41)
+LOG_PRIOR = -0.5 * QUAD_POINTS ** 2
+LOG_PRIOR -= np.log(np.exp(LOG_PRIOR).sum())
+
+# Items only carry one location (b) until they are calibrated with their own
+# thresholds; the category boundaries are spread around it.
+GRM_THRESHOLD_OFFSETS = np.array([-2.0, -0.75, 0.75, 2.0])
+
+# "eap" (posterior mean/SD) or "map" (posterior mode, SE from its curvature)
+THETA_METHOD = os.getenv("THETA_METHOD", "eap")
+
+# Standard normal CDF on the grid, for theta -> 0-100 percentile
+_PRIOR_CDF = np.array([0.5 * (1.0 + math.erf(q / math.sqrt(2.0))) for q in QUAD_POINTS])
+
+
+def category_log_probs(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """log P(X = k | theta) for every item, category and grid point: (items, 5, grid)."""
+    thresholds = b[:, None] + GRM_THRESHOLD_OFFSETS[None, :]
+    p_star = 1.0 / (1.0 + np.exp(-a[:, None, None] * (QUAD_POINTS[None, None, :] - thresholds[:, :, None])))
+    ones = np.ones((len(a), 1, len(QUAD_POINTS)))
+    zeros = np.zeros((len(a), 1, len(QUAD_POINTS)))
+    probs = np.concatenate([ones, p_star], axis=1) - np.concatenate([p_star, zeros], axis=1)
+    return np.log(np.clip(probs, 1e-300, None))
+
+
+def posterior(loglik: np.ndarray, method: str = THETA_METHOD) -> Tuple[np.ndarray, np.ndarray]:
+    """(theta, se) from log-likelihoods on the grid; works on (..., grid) arrays."""
+    log_post = loglik + LOG_PRIOR
+    if method == "map":
+        h = QUAD_POINTS[1] - QUAD_POINTS[0]
+        k = np.clip(np.argmax(log_post, axis=-1), 1, len(QUAD_POINTS) - 2)[..., None]
+        left, mid, right = (np.take_along_axis(log_post, k + d, axis=-1)[..., 0] for d in (-1, 0, 1))
+        curvature = np.minimum(left - 2 * mid + right, -1e-9) # < 0 around a maximum
+        # Parabola through the three points around the best grid point
+        offset = np.clip(0.5 * (left - right) / curvature, -1.0, 1.0)
+        theta = QUAD_POINTS[k[..., 0]] + offset * h
+        se = h / np.sqrt(-curvature)
+        return theta, se
+
+    log_post = log_post - log_post.max(axis=-1, keepdims=True)
+    weights = np.exp(log_post)
+    weights /= weights.sum(axis=-1, keepdims=True)
+    theta = weights @ QUAD_POINTS
+    se = np.sqrt(np.maximum(weights @ QUAD_POINTS ** 2 - theta ** 2, 0.0))
+    return theta, se
+
+
+def theta_to_percentile(theta) -> np.ndarray:
+    """0-100 score: the share of the N(0, 1) population below theta."""
+    return 100.0 * np.interp(theta, QUAD_POINTS, _PRIOR_CDF)
+
+
+def response_category(value: int) -> int:
+    """Keyed Likert value (1-5) -> GRM category (0-4)."""
+    return min(max(int(value), 1), N_CATEGORIES) - 1
+
+
+class GRMScorer:
+    """Category log-probability tables for one item bank snapshot."""
+
+    def __init__(self, bank: ItemBank):
+        self.bank = bank
+        self.log_probs = category_log_probs(bank.a, bank.b)
+        self.log_probs.setflags(write=False)
+
+    def loglik(self, item_ids: Iterable[int], categories: Iterable[int]) -> np.ndarray:
+        """Log-likelihood on the grid of one set of answers (unknown items are ignored)."""
+        row_of = self.bank.row_of
+        pairs = [(row_of[i], c) for i, c in zip(item_ids, categories) if i in row_of]
+        if not pairs:
+            return np.zeros(len(QUAD_POINTS))
+        rows, cats = zip(*pairs)
+        return self.log_probs[list(rows), list(cats)].sum(axis=0)
+
+    def estimate(self, item_ids: Iterable[int], categories: Iterable[int], method: str = THETA_METHOD) -> Tuple[float, float]:
+        """(theta, se) for one trait of one session."""
+        theta, se = posterior(self.loglik(item_ids, categories), method)
+        return float(theta), float(se)
+
+    def score_batch(self, group: np.ndarray, item_rows: np.ndarray, categories: np.ndarray,
+                    n_groups: int, method: str = THETA_METHOD) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (theta, se) arrays of length n_groups for many answer sets at once,
+        e.g. group = session * n_traits + trait. Groups without answers get
+        the prior (theta 0, se 1).
+        """
+        n_quad = len(QUAD_POINTS)
+        per_answer = self.log_probs[item_rows, categories] # (answers, grid)
+        # One bincount for all groups and grid points
+        flat = (group[:, None] * n_quad + np.arange(n_quad)[None, :]).ravel()
+        loglik = np.bincount(flat, weights=per_answer.ravel(), minlength=n_groups * n_quad)
+        return posterior(loglik.reshape(n_groups, n_quad), method)
+
+
+_scorer: Optional[GRMScorer] = None
+
+def get_scorer(bank: ItemBank) -> GRMScorer:
+    """The scorer for this bank snapshot, rebuilt when the bank is reloaded."""
+    global _scorer
+    scorer = _scorer
+    if scorer is None or scorer.bank is not bank:
+        scorer = _scorer = GRMScorer(bank)
+    return scorer
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+import numpy as np
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.database import invalidate_on_commit
+from app.models import PsychometricItem
+
+# The item bank only changes when items are seeded or recalibrated, but it is
+# read on every /next_item and /submit call. We keep one immutable snapshot per
+# worker process and swap it out when the bank changes. Writes through this
+# worker's ORM invalidate immediately; the TTL bounds staleness for writes made
+# by other workers or directly in the database.
+ITEM_BANK_TTL_SECONDS = float(os.getenv("ITEM_BANK_TTL_SECONDS", "60"))
+
+@dataclass(frozen=True)
+class BankItem:
+    id: int
+    text: str
+    trait: str
+    keyed: str
+    difficulty: float
+    discrimination: float
+    is_validity_check: bool
+    validity_type: Optional[str]
+
+
+class ItemBank:
+    """
+    Read-only snapshot of psych_items, indexed by id, trait,
+    keyed direction and validity flag.
+    """
+
+    def __init__(self, items: Iterable[BankItem], version: int):
+        self.version = version
+        self.items = tuple(sorted(items, key=lambda i: i.id))
+        self.by_id = MappingProxyType({i.id: i for i in self.items})
+
+        by_trait = {}
+        by_keyed = {}
+        for i in self.items:
+            by_trait.setdefault(i.trait, []).append(i)
+            by_keyed.setdefault(i.keyed, []).append(i)
+        self.by_trait = MappingProxyType({k: tuple(v) for k, v in by_trait.items()})
+        self.by_keyed = MappingProxyType({k: tuple(v) for k, v in by_keyed.items()})
+
+        self.validity_items = tuple(i for i in self.items if i.is_validity_check)
+        self.trait_items = tuple(i for i in self.items if not i.is_validity_check)
+
+        # Column arrays for vectorized selection/scoring (row order == self.items)
+        self.traits = tuple(by_trait.keys())
+        trait_pos = {t: n for n, t in enumerate(self.traits)}
+        self.row_of = MappingProxyType({i.id: n for n, i in enumerate(self.items)})
+        self.ids = np.array([i.id for i in self.items], dtype=np.int64)
+        self.a = np.array([i.discrimination for i in self.items], dtype=np.float64)
+        self.b = np.array([i.difficulty for i in self.items], dtype=np.float64)
+        self.trait_index = np.array([trait_pos[i.trait] for i in self.items], dtype=np.intp)
+        self.is_validity = np.array([i.is_validity_check for i in self.items], dtype=bool)
+        self.reverse_keyed = np.array([i.keyed == "minus" for i in self.items], dtype=bool)
+        for arr in (self.ids, self.a, self.b, self.trait_index, self.is_validity, self.reverse_keyed):
+            arr.flags.writeable = False
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, item_id: int) -> Optional[BankItem]:
+        return self.by_id.get(item_id)
+
+    def available(self, answered_ids) -> list:
+        """Items not yet answered in a session."""
+        answered = set(answered_ids)
+        return [i for i in self.items if i.id not in answered]
+
+    def rows(self, item_ids) -> np.ndarray:
+        """Row positions for the given item ids (unknown ids are skipped)."""
+        row_of = self.row_of
+        return np.array([row_of[i] for i in item_ids if i in row_of], dtype=np.intp)
+
+
+_bank: Optional[ItemBank] = None
+_bank_loaded_at = 0.0
+_version = 0
+_lock = threading.Lock()
+
+
+def _build(rows, version: int) -> ItemBank:
+    items = [
+        BankItem(
+            id=r.id,
+            text=r.text,
+            trait=r.trait,
+            keyed=r.keyed or "plus",
+            difficulty=r.difficulty if r.difficulty is not None else 0.0,
+            discrimination=r.discrimination if r.discrimination is not None else 1.0,
+            is_validity_check=bool(r.is_validity_check),
+            validity_type=r.validity_type,
+        )
+        for r in rows
+    ]
+    return ItemBank(items, version)
+
+
+def _cached() -> Optional[ItemBank]:
+    bank = _bank
+    if bank is not None and time.monotonic() - _bank_loaded_at < ITEM_BANK_TTL_SECONDS:
+        return bank
+    return None
+
+
+def _publish(bank: ItemBank) -> ItemBank:
+    global _bank, _bank_loaded_at
+    # Don't publish a snapshot if the bank was invalidated while loading,
+    # nor an empty one: the items may be seeded by another process.
+    if bank.version == _version and len(bank) > 0:
+        _bank = bank
+        _bank_loaded_at = time.monotonic()
+    return bank
+
+
+def get_item_bank(db: Session) -> ItemBank:
+    """
+    Returns the cached item bank, loading it from the DB on first use
+    (or after an invalidation). Sync version, for scripts and threads.
+    """
+    bank = _cached()
+    if bank is not None:
+        return bank
+
+    with _lock:
+        bank = _cached()
+        if bank is not None:
+            return bank
+        version = _version
+        return _publish(_build(db.query(PsychometricItem).all(), version))
+
+
+async def get_item_bank_async(db: AsyncSession) -> ItemBank:
+    """
+    Async version of get_item_bank for the API routes. No lock: a
+    threading lock held across an await would block the event loop, and
+    two concurrent cold loads are harmless.
+    """
+    bank = _cached()
+    if bank is not None:
+        return bank
+
+    version = _version
+    result = await db.execute(select(PsychometricItem))
+    return _publish(_build(result.scalars().all(), version))
+
+
+def invalidate_item_bank():
+    """Drops the cached snapshot; the next reader reloads it."""
+    global _bank, _version
+    # No lock here: a loader that is mid-flight sees the version change
+    # and won't publish its (possibly stale) snapshot.
+    _version += 1
+    _bank = None
+
+
+def item_bank_version() -> int:
+    return _version
+
+
+# Invalidate automatically when items are written through the ORM
+invalidate_on_commit(PsychometricItem, invalidate_item_bank)
@@ -1,20 +1,63 @@
-import spacy
-import whisper
 import os
 import random
+import threading
+import numpy as np
+from app.engines.audio import split_speech
+from app.engines.language_cache import content_key, text_analysis_cache
+from app.engines import whisper_profiles
+from app.startup import timed
 
-# Load Spacy model (assuming en_core_web_sm is installed in Docker)
-# If not, we handle the error or download it.
-try:
-    nlp = spacy.load("en_core_web_sm")
-except:
-    # Fallback or download
-    # os.system("python -m spacy download en_core_web_sm")
-    # nlp = spacy.load("en_core_web_sm")
-    nlp = None
+# spaCy and Whisper (torch) take seconds to import and load, so both are
+# loaded on first use (or by app.startup.warmup), not at import time.
+
+# The analysis only needs tokens and lexical attributes (is_alpha), so every
+# trained component is left out; the tokenizer alone gives identical results.
+SPACY_EXCLUDE = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"]
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "256"))
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "1"))
+SPACY_MULTIPROCESS_MIN_TEXTS = 2000 # process start-up only pays off for big batches
+
+nlp = None
+_nlp_loaded = False
+_nlp_lock = threading.Lock()
+_whisper_lock = threading.Lock()
+
+def get_nlp():
+    """The spaCy pipeline, or None if en_core_web_sm is not installed."""
+    global nlp, _nlp_loaded
+    if not _nlp_loaded:
+        with _nlp_lock:
+            if not _nlp_loaded:
+                # Load Spacy model (assuming en_core_web_sm is installed in Docker)
+                try:
+                    with timed("import spacy"):
+                        import spacy
+                    with timed("spacy.load en_core_web_sm"):
+                        nlp = spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+                except Exception as e:
+                    # os.system("python -m spacy download en_core_web_sm")
+                    print(f"Spacy model not available: {e}")
+                    nlp = None
+                _nlp_loaded = True
+    return nlp
 
 # Load Whisper model (lazy loading to save startup time)
 whisper_model = None
+whisper_profile = whisper_profiles.active_profile() # WHISPER_PROFILE
+
+# Bump when analyze_audio/analyze_text return something different for the
+# same input, so cached results are not reused.
+ANALYSIS_VERSION = "2"
+
+def transcription_cache_key(audio: np.ndarray) -> str:
+    samples = np.ascontiguousarray(audio, dtype=np.float32)
+    return content_key("audio", whisper_profile.cache_id, ANALYSIS_VERSION, samples.tobytes())
+
+def text_cache_key(text: str) -> str:
+    import spacy # Already imported: only called once get_nlp() returned a model
+    model = get_nlp()
+    return content_key("text", spacy.__version__, model.meta.get("name", ""), model.meta.get("version", ""),
+                       ",".join(model.pipe_names), ANALYSIS_VERSION, text)
 
 class LanguageEngine:
     def __init__(self):
@@ -23,39 +66,81 @@ class LanguageEngine:
     def _load_whisper(self):
         global whisper_model
         if whisper_model is None:
-            # Use "tiny" or "base" for speed in this demo
-            whisper_model = whisper.load_model("tiny")
+            with _whisper_lock:
+                if whisper_model is None:
+                    with timed(f"whisper load_model {whisper_profile.model} ({whisper_profile.name})"):
+                        whisper_model = whisper_profiles.load_model(whisper_profile)
         return whisper_model
 
-    def analyze_audio(self, audio_path: str):
-        """
-        Transcribes audio and analyzes fluency.
-        """
+    def transcribe(self, audio) -> str:
         model = self._load_whisper()
-        result = model.transcribe(audio_path)
-        text = result["text"]
-        
-        # Basic Fluency Metrics
-        # WPM (Words Per Minute) - simplified
-        # We would need audio duration from ffmpeg or the file metadata
-        # For now, let's just return the text and a mock score
-        
-        analysis = self.analyze_text(text)
-        
+        return whisper_profiles.transcribe(model, whisper_profile, audio)
+
+    def build_result(self, texts, speaking_seconds: float, audio_seconds: float):
+        """Stitches chunk transcripts (in order) and adds fluency metrics."""
+        text = " ".join(t for t in texts if t)
+        analysis = dict(self.analyze_text(text))
+
+        # Words per minute over the time actually spent speaking
+        words = len(text.split())
+        analysis["speaking_seconds"] = round(speaking_seconds, 2)
+        analysis["audio_seconds"] = round(audio_seconds, 2)
+        analysis["wpm"] = round(words * 60 / speaking_seconds, 1) if speaking_seconds > 0 else 0.0
+
         return {
             "transcription": text,
             "analysis": analysis
         }
 
+    def analyze_audio(self, audio):
+        """
+        Transcribes audio and analyzes fluency.
+        `audio` is a file path or a 16 kHz mono float32 array (see engines/audio.py).
+        Chunks are transcribed one after another here; TranscriptionService
+        spreads them over its worker processes instead.
+        """
+        if isinstance(audio, str):
+            import whisper
+            audio = whisper.load_audio(audio)
+        chunks, speaking_seconds, audio_seconds = split_speech(audio)
+        texts = [self.transcribe(chunk) for chunk in chunks]
+        return self.build_result(texts, speaking_seconds, audio_seconds)
+
     def analyze_text(self, text: str):
         """
         Analyzes vocabulary richness and grammar using Spacy.
         """
-        if not nlp:
-            return {"error": "Spacy model not loaded"}
-            
-        doc = nlp(text)
-        
+        return self.analyze_texts([text])[0]
+
+    def analyze_texts(self, texts):
+        """
+        analyze_text for many texts: cached ones are skipped and the rest go
+        through nlp.pipe in batches (in several processes for large batches).
+        """
+        model = get_nlp()
+        if not model:
+            return [{"error": "Spacy model not loaded"} for _ in texts]
+
+        keys = [text_cache_key(text) for text in texts]
+        found = {}
+        todo = {} # key -> index of the first text with that key
+        for n, key in enumerate(keys):
+            if key in found or key in todo:
+                continue
+            cached = text_analysis_cache.get(key)
+            if cached is None:
+                todo[key] = n
+            else:
+                found[key] = cached
+
+        n_process = SPACY_N_PROCESS if len(todo) >= SPACY_MULTIPROCESS_MIN_TEXTS else 1
+        docs = model.pipe((texts[n] for n in todo.values()), batch_size=SPACY_BATCH_SIZE, n_process=n_process)
+        for key, doc in zip(todo, docs):
+            found[key] = self._analyze_doc(doc)
+            text_analysis_cache.set(key, found[key])
+        return [dict(found[key]) for key in keys]
+
+    def _analyze_doc(self, doc):
         # Lexical Diversity (Unique words / Total words)
         words = [token.text.lower() for token in doc if token.is_alpha]
         if not words:
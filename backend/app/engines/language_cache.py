@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+from app.cache import TTLCache
+
+# Content-addressed caches for the language engine: identical recordings
+# (retries, double submits) and identical transcripts skip Whisper/spaCy.
+# Keys are hashes of the content plus everything that affects the result,
+# so entries never need invalidating; changing a model just changes keys.
+
+LANGUAGE_CACHE_MAX_ENTRIES = int(os.getenv("LANGUAGE_CACHE_MAX_ENTRIES", "1024"))
+LANGUAGE_CACHE_DIR = os.getenv("LANGUAGE_CACHE_DIR") # unset = memory only
+LANGUAGE_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LANGUAGE_CACHE_MAX_DISK_ENTRIES", "100000"))
+
+def content_key(*parts) -> str:
+    """sha256 over the given parts (bytes or str), unambiguously separated."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    In-memory LRU in front of an optional directory of JSON files, which is
+    shared by every process on the host and survives restarts.
+    """
+
+    def __init__(self, name: str, max_entries: int = LANGUAGE_CACHE_MAX_ENTRIES,
+                 directory: Optional[str] = LANGUAGE_CACHE_DIR,
+                 max_disk_entries: int = LANGUAGE_CACHE_MAX_DISK_ENTRIES):
+        self.name = name
+        self.memory = TTLCache(max_entries=max_entries)
+        self.directory = Path(directory) / name if directory else None
+        self.max_disk_entries = max_disk_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.memory.get(key)
+        if value is not None or self.directory is None:
+            return value
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: dict):
+        self.memory.set(key, value)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp, path) # Readers never see a partial file
+        except OSError as e:
+            print(f"Language cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 1000 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drops the least recently written files beyond max_disk_entries."""
+        try:
+            files = [(p.stat().st_mtime, p) for p in self.directory.glob("*/*.json")]
+        except OSError:
+            return
+        excess = len(files) - self.max_disk_entries
+        if excess <= 0:
+            return
+        files.sort()
+        for _, p in files[:excess]:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            **self.memory.stats(),
+            "disk_hits": self.disk_hits,
+            "disk_dir": str(self.directory) if self.directory else None,
+        }
+
+
+# Full analyze_audio results, keyed by decoded samples + model/analysis version
+transcription_cache = ResultCache("transcriptions")
+# analyze_text results, keyed by transcript + spaCy/model versions
+text_analysis_cache = ResultCache("text_analysis")
@@ -1,76 +1,351 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import invalidate_on_commit, on_commit_inserts
+from app.cache import TTLCache
 from app.models import CandidateProfile, JobProfile
+from app.engines.similarity import candidate_index, MAX_DISTANCE
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import time
+import hashlib
 import json
+import os
 
-class MatchmakerEngine:
-    def __init__(self, db: Session):
-        self.db = db
+DEFAULT_SCORE = 50 # Default to average if missing
+
+class CompiledJob:
+    """
+    A job benchmark flattened into aligned trait / ideal / weight arrays,
+    so many candidates can be scored against it in one NumPy operation.
+    """
 
-    def calculate_fit(self, candidate_id: int, job_profile_id: int):
+    def __init__(self, job_id: int, target_profile: Dict[str, Dict], title: str = None):
+        self.job_id = job_id
+        self.title = title
+        # target structure: {"min": 40, "max": 60, "ideal": 50, "weight": 1.0}
+        # or simplified: {"ideal": 80, "weight": 2.0}
+        self.traits: Tuple[str, ...] = tuple(target_profile.keys())
+        self.ideals = np.array([t.get("ideal", 50) for t in target_profile.values()], dtype=np.float64)
+        self.weights = np.array([t.get("weight", 1.0) for t in target_profile.values()], dtype=np.float64)
+        # Content hash, so edits made outside the API still change the version
+        canonical = json.dumps(target_profile, sort_keys=True, default=str)
+        self.version = hashlib.sha1(canonical.encode()).hexdigest()[:12]
+
+    def candidate_matrix(self, score_dicts: List[Dict]) -> np.ndarray:
+        """candidates x traits matrix of candidate scores for this job's traits."""
+        return np.array(
+            [[_numeric(scores.get(trait)) for trait in self.traits] for scores in score_dicts],
+            dtype=np.float64,
+        ).reshape(len(score_dicts), len(self.traits))
+
+    def fit(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Calculates the % fit between a candidate and a job.
+        Returns (fit_percentages, gaps) for a candidates x traits matrix.
         """
-        # Get Candidate Profile (Latest)
-        # In real app, we might want to average multiple sessions or pick the best.
-        profile = self.db.query(CandidateProfile).filter(
-            CandidateProfile.candidate_id == candidate_id
-        ).order_by(CandidateProfile.created_at.desc()).first()
-        
-        job = self.db.query(JobProfile).filter(JobProfile.id == job_profile_id).first()
-        
-        if not profile or not job:
-            return {"error": "Profile or Job not found"}
-            
-        candidate_scores = profile.scores # JSON
-        target_scores = job.target_profile # JSON
-        
-        total_weighted_gap = 0
-        total_possible_weight = 0
-        
-        details = {}
-        
-        # Iterate through target traits (OCEAN, IQ, etc.)
-        for trait, target in target_scores.items():
-            # target structure: {"min": 40, "max": 60, "ideal": 50, "weight": 1.0}
-            # or simplified: {"ideal": 80, "weight": 2.0}
-            
-            ideal = target.get("ideal", 50)
-            weight = target.get("weight", 1.0)
-            
-            candidate_val = candidate_scores.get(trait, 50) # Default to average if missing
-            
-            # Calculate Gap
-            gap = abs(candidate_val - ideal)
-            
-            # Weighted Penalty
-            # If gap is 0, penalty is 0. If gap is 100, penalty is max.
-            weighted_gap = gap * weight
-            
-            total_weighted_gap += weighted_gap
-            total_possible_weight += (100 * weight)
-            
-            details[trait] = {
-                "candidate": candidate_val,
-                "ideal": ideal,
-                "gap": gap,
-                "status": "green" if gap < 10 else "yellow" if gap < 20 else "red"
-            }
-            
+        # Calculate Gap
+        gaps = np.abs(values - self.ideals)
+
+        # Weighted Penalty
+        # If gap is 0, penalty is 0. If gap is 100, penalty is max.
+        total_weighted_gap = gaps @ self.weights
+        total_possible_weight = 100 * self.weights.sum()
+
         # Calculate Fit %
         # 100% - (Total Gap / Max Possible Gap)
         # Max Possible Gap is if candidate is 0 and ideal is 100 (gap 100) for all traits.
-        
         if total_possible_weight == 0:
-            fit_percentage = 0
+            fit_percentage = np.zeros(len(values))
         else:
             fit_percentage = 100 - (total_weighted_gap / total_possible_weight * 100)
-            
+
         # Boost curve (to make scores look more normal, like grades)
         # Raw 80% is actually excellent match.
-        fit_percentage = min(100, fit_percentage * 1.1)
-        
+        fit_percentage = np.minimum(100, fit_percentage * 1.1)
+        return fit_percentage, gaps
+
+    def result(self, fit_percentage: float, values: np.ndarray, gaps: np.ndarray) -> Dict:
+        """Builds the API payload for one candidate's row."""
+        details = {}
+        for trait, candidate_val, ideal, gap in zip(self.traits, values.tolist(), self.ideals.tolist(), gaps.tolist()):
+            details[trait] = {
+                "candidate": _plain(candidate_val),
+                "ideal": _plain(ideal),
+                "gap": _plain(gap),
+                "status": "green" if gap < 10 else "yellow" if gap < 20 else "red"
+            }
+
+        fit_percentage = float(fit_percentage)
         return {
             "fit_score": round(fit_percentage, 1),
             "details": details,
             "recommendation": "Highly Recommended" if fit_percentage > 85 else "Recommended" if fit_percentage > 70 else "Not Recommended"
         }
+
+def _numeric(value):
+    # Non-numeric scores (e.g. English_Level "B2") can't be compared on a 0-100 scale
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return DEFAULT_SCORE
+
+def _plain(value: float):
+    # Keep integer-valued scores as ints in the JSON payload
+    return int(value) if float(value).is_integer() else value
+
+class JobMatrix:
+    """
+    All job benchmarks compiled once into jobs x traits ideal/weight matrices
+    (over the union of traits), for scoring one candidate against every job.
+    """
+
+    def __init__(self, jobs: List[CompiledJob], version: int):
+        self.version = version
+        self.jobs = tuple(jobs)
+        self.by_id = {j.job_id: j for j in self.jobs}
+        self.traits = tuple(dict.fromkeys(t for j in self.jobs for t in j.traits))
+        col = {t: n for n, t in enumerate(self.traits)}
+
+        self.job_ids = np.array([j.job_id for j in self.jobs], dtype=np.int64)
+        self.ideals = np.zeros((len(self.jobs), len(self.traits)))
+        self.weights = np.zeros((len(self.jobs), len(self.traits)))
+        for n, j in enumerate(self.jobs):
+            cols = [col[t] for t in j.traits]
+            self.ideals[n, cols] = j.ideals
+            self.weights[n, cols] = j.weights
+
+    def job(self, job_id: int) -> Optional[CompiledJob]:
+        return self.by_id.get(job_id)
+
+    def fit(self, scores: Dict) -> np.ndarray:
+        """Fit percentage of one candidate against every job."""
+        values = np.array([_numeric(scores.get(t)) for t in self.traits], dtype=np.float64)
+        # Traits a job doesn't target have weight 0, so they drop out of both sums
+        total_weighted_gap = (np.abs(values - self.ideals) * self.weights).sum(axis=1)
+        total_possible_weight = 100 * self.weights.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fit_percentage = np.where(
+                total_possible_weight == 0,
+                0.0,
+                100 - (total_weighted_gap / total_possible_weight * 100)
+            )
+        return np.minimum(100, fit_percentage * 1.1)
+
+# Job benchmarks are edited rarely; compile them once per worker.
+# Writes through the ORM invalidate immediately, the TTL bounds staleness
+# for edits made directly in the database.
+JOB_MATRIX_TTL_SECONDS = float(os.getenv("JOB_MATRIX_TTL_SECONDS", "300"))
+
+_job_matrix: Optional[JobMatrix] = None
+_job_matrix_loaded_at = 0.0
+_job_matrix_version = 0
+
+async def get_job_matrix(db: AsyncSession) -> JobMatrix:
+    global _job_matrix, _job_matrix_loaded_at
+    matrix = _job_matrix
+    if matrix is not None and time.monotonic() - _job_matrix_loaded_at < JOB_MATRIX_TTL_SECONDS:
+        return matrix
+
+    # Concurrent cold loads are harmless; whichever finishes last wins
+    version = _job_matrix_version
+    result = await db.execute(select(JobProfile).order_by(JobProfile.id))
+    jobs = [
+        CompiledJob(j.id, j.target_profile or {}, j.title)
+        for j in result.scalars()
+    ]
+    matrix = JobMatrix(jobs, version)
+    if version == _job_matrix_version:
+        _job_matrix = matrix
+        _job_matrix_loaded_at = time.monotonic()
+    return matrix
+
+def invalidate_job_matrix():
+    global _job_matrix, _job_matrix_version
+    _job_matrix_version += 1
+    _job_matrix = None
+    # Entries for an edited job are unreachable under its new version anyway
+    fit_cache.clear()
+
+# Fit results keyed by (profile_id, job_id, job_version), plus the latest
+# profile per candidate so a cache hit needs no query at all. New profiles
+# written through the ORM invalidate both; the TTL covers profiles inserted
+# directly in Supabase by the frontend.
+FIT_CACHE_TTL_SECONDS = float(os.getenv("FIT_CACHE_TTL_SECONDS", "60"))
+FIT_CACHE_MAX_ENTRIES = int(os.getenv("FIT_CACHE_MAX_ENTRIES", "10000"))
+
+fit_cache = TTLCache(FIT_CACHE_MAX_ENTRIES, FIT_CACHE_TTL_SECONDS)
+latest_profile_cache = TTLCache(FIT_CACHE_MAX_ENTRIES, FIT_CACHE_TTL_SECONDS)
+
+def invalidate_candidate_fits(candidate_id: int):
+    previous = latest_profile_cache.pop(candidate_id)
+    if previous is not None:
+        fit_cache.pop_where(lambda key: key[0] == previous[0])
+
+def fit_etag(profile_id: int, job_id: int, job_version: str) -> str:
+    return f'"fit-{profile_id}-{job_id}-{job_version}"'
+
+invalidate_on_commit(JobProfile, invalidate_job_matrix)
+on_commit_inserts(CandidateProfile, lambda p: p.candidate_id, invalidate_candidate_fits)
+
+def latest_profiles_query():
+    """
+    Latest profile per candidate as (candidate_id, id, scores) rows,
+    in one statement.
+    """
+    ranked = select(
+        CandidateProfile.candidate_id,
+        CandidateProfile.id,
+        CandidateProfile.scores,
+        func.row_number().over(
+            partition_by=CandidateProfile.candidate_id,
+            order_by=(CandidateProfile.created_at.desc(), CandidateProfile.id.desc())
+        ).label("rn")
+    ).subquery()
+    return select(ranked.c.candidate_id, ranked.c.id, ranked.c.scores).where(ranked.c.rn == 1)
+
+class MatchmakerEngine:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _latest_profile(self, candidate_id: int) -> Optional[CandidateProfile]:
+        # Get Candidate Profile (Latest)
+        # In real app, we might want to average multiple sessions or pick the best.
+        result = await self.db.execute(
+            select(CandidateProfile)
+            .where(CandidateProfile.candidate_id == candidate_id)
+            .order_by(CandidateProfile.created_at.desc(), CandidateProfile.id.desc())
+            .limit(1)
+        )
+        return result.scalars().first()
+
+    async def calculate_fit(self, candidate_id: int, job_profile_id: int):
+        """
+        Calculates the % fit between a candidate and a job.
+        """
+        profile = await self._latest_profile(candidate_id)
+        compiled = (await get_job_matrix(self.db)).job(job_profile_id)
+
+        if not profile or not compiled:
+            return {"error": "Profile or Job not found"}
+
+        values = compiled.candidate_matrix([profile.scores])
+        fit, gaps = compiled.fit(values)
+        return compiled.result(fit[0], values[0], gaps[0])
+
+    async def cached_fit(self, candidate_id: int, job_profile_id: int):
+        """
+        calculate_fit through the fit cache.
+        Returns (result, etag); etag is None on error.
+        """
+        compiled = (await get_job_matrix(self.db)).job(job_profile_id)
+        latest = latest_profile_cache.get(candidate_id)
+        if latest is None:
+            profile = await self._latest_profile(candidate_id)
+            if profile:
+                latest = (profile.id, profile.scores or {})
+                latest_profile_cache.set(candidate_id, latest)
+
+        if not latest or not compiled:
+            return {"error": "Profile or Job not found"}, None
+
+        profile_id, scores = latest
+        key = (profile_id, compiled.job_id, compiled.version)
+        result = fit_cache.get(key)
+        if result is None:
+            values = compiled.candidate_matrix([scores])
+            fit, gaps = compiled.fit(values)
+            result = compiled.result(fit[0], values[0], gaps[0])
+            fit_cache.set(key, result)
+        return result, fit_etag(*key)
+
+    async def rank_candidates(self, job_profile_id: int, top_k: int = 10):
+        """
+        Scores every candidate's latest profile against a job in one
+        vectorized pass and returns the top_k best fits.
+        """
+        compiled = (await get_job_matrix(self.db)).job(job_profile_id)
+        if not compiled:
+            return {"error": "Job not found"}
+
+        rows = (await self.db.execute(latest_profiles_query())).all()
+        values = compiled.candidate_matrix([r.scores or {} for r in rows])
+        fit, gaps = compiled.fit(values)
+
+        # Partial sort: only the top_k rows get fully ordered
+        k = min(top_k, len(rows))
+        if k == 0:
+            top = np.array([], dtype=np.intp)
+        else:
+            top = np.argpartition(-fit, k - 1)[:k]
+            top = top[np.argsort(-fit[top], kind="stable")]
+
+        results = []
+        for n in top:
+            row = rows[n]
+            results.append({
+                "candidate_id": row.candidate_id,
+                "profile_id": row.id,
+                **compiled.result(fit[n], values[n], gaps[n])
+            })
+
+        return {
+            "job_id": compiled.job_id,
+            "candidates_scored": len(rows),
+            "results": results
+        }
+
+    async def rank_jobs(self, candidate_id: int, top_k: int = 10):
+        """
+        Scores a candidate's latest profile against every job benchmark
+        at once and returns the top_k best matching jobs.
+        """
+        profile = await self._latest_profile(candidate_id)
+        if not profile:
+            return {"error": "Profile not found"}
+
+        matrix = await get_job_matrix(self.db)
+        scores = profile.scores or {}
+        fit = matrix.fit(scores)
+        order = np.argsort(-fit, kind="stable")[:top_k]
+
+        results = []
+        for n in order:
+            compiled = matrix.jobs[n]
+            values = compiled.candidate_matrix([scores])[0]
+            gaps = np.abs(values - compiled.ideals)
+            results.append({
+                "job_id": compiled.job_id,
+                "title": compiled.title,
+                **compiled.result(fit[n], values, gaps)
+            })
+
+        return {
+            "candidate_id": candidate_id,
+            "profile_id": profile.id,
+            "jobs_scored": len(matrix.jobs),
+            "results": results
+        }
+
+    def similar_candidates(self, candidate_id: int, k: int = 10):
+        """
+        Nearest candidates to this one's latest profile in trait space
+        (see engines/similarity.py).
+        """
+        if not candidate_index.ready:
+            return {"error": "Similarity index is still loading", "status": 503}
+
+        vector = candidate_index.vector_of(candidate_id)
+        if vector is None:
+            return {"error": "Profile not found", "status": 404}
+
+        neighbours = candidate_index.query(vector, k, exclude_candidate=candidate_id)
+        return {
+            "candidate_id": candidate_id,
+            "results": [
+                {
+                    "candidate_id": other_id,
+                    "profile_id": profile_id,
+                    "distance": round(distance, 4),
+                    "similarity": round(100 * (1 - distance / MAX_DISTANCE), 1)
+                }
+                for other_id, profile_id, distance in neighbours
+            ]
+        }
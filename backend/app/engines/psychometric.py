@@ -1,19 +1,62 @@
+import asyncio
 import json
 import os
-import random
 import numpy as np
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import PsychometricItem, TestSession, ItemResponse
+from app.engines.item_bank import get_item_bank_async, invalidate_item_bank
+from app.engines.cat import FisherItemSelector, StoppingRule
+from app.engines.irt import get_scorer, response_category
+from app.engines.session_store import SessionState, StaleState, get_session_store, SESSION_FLUSH_BATCH
 
 # Since we don't have real IRT calibration for these specific IPIP items in the prompt,
 # we will simulate parameters for the "God-Tier" demo.
 # In a real scenario, these would come from the database after calibration.
 
+def keyed_score(item, value: int) -> int:
+    """Reverse scores minus-keyed items (1->5, 5->1)."""
+    if item.keyed == "minus":
+        return 6 - value
+    return value
+
+def add_to_trait_stats(stats, item_id: int, score: int) -> dict:
+    """
+    Returns updated running stats for one trait: the answer count "n" and
+    the (item, category) "responses" the GRM scorer needs. theta/se are
+    carried over until estimate_trait refreshes them.
+    """
+    stats = stats or {"n": 0}
+    return {
+        **{k: stats[k] for k in ("theta", "se") if k in stats},
+        "n": stats["n"] + 1,
+        "responses": stats.get("responses", []) + [[item_id, response_category(score)]],
+    }
+
+def estimate_trait(stats: dict, bank) -> dict:
+    """Stats with the trait's posterior theta and SE (GRM, see engines/irt.py)."""
+    item_ids, categories = zip(*stats["responses"])
+    theta, se = get_scorer(bank).estimate(item_ids, categories)
+    return {**stats, "theta": round(theta, 4), "se": round(se, 4)}
+
+# Seeding psych_items: one at a time per worker (and across workers on Postgres)
+_seed_lock = asyncio.Lock()
+
+# Shared across requests so the exposure-control RNG isn't re-seeded per call.
+# Tests stop early once every trait is measured precisely (CAT_* env vars).
+default_selector = FisherItemSelector(stopping=StoppingRule.from_env())
+
 class PsychometricEngine:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, selector: FisherItemSelector = None, store=None,
+                 stopping: StoppingRule = None):
         self.db = db
+        self.selector = selector or default_selector
+        # Overrides the selector's stopping rule (SE target, min/max items, balance)
+        self.stopping = stopping
+        # Write-behind session state (engines/session_store.py); None = write-through
+        self.store = store or get_session_store()
 
-    def initialize_session(self, candidate_id: int):
+    async def initialize_session(self, candidate_id: int):
         """Starts a new CAT session for a candidate."""
         # Create session in DB
         session = TestSession(candidate_id=candidate_id, current_theta={
@@ -23,54 +66,123 @@ class PsychometricEngine:
             "Agreeableness": 0.0,
             "Neuroticism": 0.0
         })
+        session.trait_stats = {}
+        session.answered_items = []
         self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
+        await self.db.commit()
+        await self.db.refresh(session)
+        if self.store:
+            self.store.put(SessionState(
+                session_id=session.id,
+                current_theta=dict(session.current_theta),
+                trait_stats={},
+                answered_items=[],
+            ))
         return session
 
-    def get_next_item(self, session_id: int):
+    async def _session_state(self, session: TestSession, bank):
         """
-        Selects the next item based on current theta (Adaptive).
-        For this MVP, we pick a random item that hasn't been answered yet
-        for the trait with the least information or round-robin.
+        Returns (trait_stats, answered_ids) for a session.
+        Sessions started before these columns existed (or before GRM
+        scoring) are rebuilt once from their responses.
         """
-        session = self.db.query(TestSession).filter(TestSession.id == session_id).first()
-        if not session:
-            return None
+        if (session.trait_stats is not None and session.answered_items is not None
+                and all("responses" in t for t in session.trait_stats.values())):
+            return dict(session.trait_stats), list(session.answered_items)
 
-        # Get answered items
-        answered_ids = [r.item_id for r in session.responses]
+        trait_stats = {}
+        answered_ids = []
+        responses = await self.db.execute(
+            select(ItemResponse.item_id, ItemResponse.response_value)
+            .where(ItemResponse.session_id == session.id)
+            .order_by(ItemResponse.id)
+        )
+        for item_id, response_value in responses:
+            answered_ids.append(item_id)
+            r_item = bank.get(item_id)
+            if r_item:
+                trait_stats[r_item.trait] = add_to_trait_stats(
+                    trait_stats.get(r_item.trait), item_id, keyed_score(r_item, response_value)
+                )
+        trait_stats = {t: estimate_trait(stats, bank) for t, stats in trait_stats.items()}
+        return trait_stats, answered_ids
 
-        # Find available items
-        available_items = self.db.query(PsychometricItem).filter(
-            PsychometricItem.id.notin_(answered_ids)
-        ).all()
+    async def get_next_item(self, session_id: int):
+        """
+        Selects the next item based on current theta (Adaptive).
+        Picks the unanswered item with the highest Fisher information at the
+        current theta of its trait (see engines/cat.py), occasionally
+        inserting a validity check. Returns None once the stopping rule is
+        met (every trait precise enough, or the maximum length).
+        """
+        bank = await get_item_bank_async(self.db)
+        if self.store:
+            state = await self._load_state(session_id, bank)
+            if state is None:
+                return None
+            return self._select_next(state.current_theta, bank, state.answered_items, state.trait_stats)
 
-        if not available_items:
-            return None # Test finished
+        session = await self.db.get(TestSession, session_id)
+        if not session:
+            return None
+        trait_stats, answered_ids = await self._session_state(session, bank)
+        return self._select_next(session.current_theta, bank, answered_ids, trait_stats)
 
-        # Simple Adaptive Logic:
-        # In a full implementation, we would calculate Fisher Information here.
-        # For now, we just pick the next available item to ensure coverage.
-        # We prioritize Validity Checks if they haven't appeared.
-        
-        # Check for validity items first
-        validity_items = [i for i in available_items if i.is_validity_check]
-        if validity_items and random.random() < 0.2: # 20% chance to insert a trap
-            return random.choice(validity_items)
+    def _select_next(self, current_theta, bank, answered_ids, trait_stats):
+        # The stopping rule uses the posterior SEs of the answered traits
+        trait_se = {t: stats["se"] for t, stats in trait_stats.items() if "se" in stats}
+        return self.selector.select(bank, current_theta or {}, answered_ids, stopping=self.stopping, trait_se=trait_se)
 
-        # Otherwise pick a random trait item
-        return random.choice(available_items)
+    async def _load_state(self, session_id: int, bank):
+        """The session's state from the store, loading it from the DB on a miss."""
+        state = self.store.get(session_id)
+        if state is not None:
+            return state
+        session = await self.db.get(TestSession, session_id)
+        if not session:
+            return None
+        trait_stats, answered_ids = await self._session_state(session, bank)
+        state = SessionState(
+            session_id=session_id,
+            current_theta=dict(session.current_theta or {}),
+            trait_stats=trait_stats,
+            answered_items=answered_ids,
+        )
+        try:
+            self.store.put(state)
+        except StaleState:
+            return self.store.get(session_id) # Another request loaded it first
+        return state
 
-    def submit_response(self, session_id: int, item_id: int, value: int, time_ms: int):
+    async def submit_response(self, session_id: int, item_id: int, value: int, time_ms: int):
         """
         Saves response and updates Theta (Score).
         """
-        session = self.db.query(TestSession).filter(TestSession.id == session_id).first()
-        item = self.db.query(PsychometricItem).filter(PsychometricItem.id == item_id).first()
+        success, _ = await self.submit_and_get_next(session_id, item_id, value, time_ms)
+        return success
+
+    async def submit_and_get_next(self, session_id: int, item_id: int, value: int, time_ms: int):
+        """
+        submit_response, plus selection of the next item from the updated
+        state in the same transaction. Returns (success, next_item); the
+        next item is None once the test is finished.
+        """
+        if self.store:
+            result = await self.submit_batch(session_id, [{"item_id": item_id, "value": value, "time_ms": time_ms}])
+            return "error" not in result, result.get("next_item")
+
+        bank = await get_item_bank_async(self.db)
+        item = bank.get(item_id)
+        if not item:
+            return False, None
+
+        # Row lock: overlapping submits (double tap, retry) apply one after the other
+        session = (await self.db.execute(
+            select(TestSession).where(TestSession.id == session_id).with_for_update()
+        )).scalar_one_or_none()
         
-        if not session or not item:
-            return False
+        if not session:
+            return False, None
 
         # Save Response
         response = ItemResponse(
@@ -83,55 +195,240 @@ class PsychometricEngine:
         
         # Update Theta (Simplified EAP/MAP estimation)
         # 1. Reverse score if needed
-        score = value
-        if item.keyed == "minus":
-            score = 6 - value # 1->5, 5->1
+        score = keyed_score(item, value)
         
-        # 2. Update running average for the trait (Simplified)
-        # In real IRT, we would maximize likelihood.
-        current_thetas = dict(session.current_theta) if session.current_theta else {}
+        # 2. Update the trait's answers and re-estimate its posterior theta
+        # (GRM over the quadrature grid), so we never need to reload the
+        # previous responses.
+        trait_stats, answered_ids = await self._session_state(session, bank)
         trait = item.trait
+        stats = estimate_trait(add_to_trait_stats(trait_stats.get(trait), item_id, score), bank)
+        trait_stats[trait] = stats
+        answered_ids.append(item_id)
         
-        # Get all responses for this trait
-        trait_responses = [r for r in session.responses if r.item.trait == trait]
-        trait_responses.append(response) # Add current one
-        
-        # Calculate simple average (normalized -2 to +2 for Theta)
-        # Likert 1-5 -> -2, -1, 0, 1, 2
-        scores = []
-        for r in trait_responses:
-            val = r.response_value
-            if r.item.keyed == "minus":
-                val = 6 - val
-            scores.append(val)
-        
-        avg_score = sum(scores) / len(scores)
-        # Map 1..5 to -2..2 roughly
-        theta = (avg_score - 3) * 1.5 
-        
-        current_thetas[trait] = theta
+        current_thetas = dict(session.current_theta) if session.current_theta else {}
+        current_thetas[trait] = stats["theta"]
         session.current_theta = current_thetas
-        
-        self.db.commit()
-        return True
+        session.trait_stats = trait_stats
+        session.answered_items = answered_ids
+
+        next_item = self._select_next(session.current_theta, bank, answered_ids, trait_stats)
+        await self.db.commit()
+        return True, next_item
+
+    async def submit_batch(self, session_id: int, answers):
+        """
+        Saves a buffered list of answers (in answer order) with one multi-row
+        insert and a single state/theta update and commit. `answers` are dicts
+        with item_id, value, time_ms and optional mouse_trajectory_entropy.
+        Items already answered in this session (e.g. a re-sent flush) are
+        skipped. Returns a result dict, or {"error": ...} without saving
+        anything if the session or an item is unknown.
+        """
+        bank = await get_item_bank_async(self.db)
+        unknown = [a["item_id"] for a in answers if bank.get(a["item_id"]) is None]
+        if unknown:
+            return {"error": f"Unknown items: {unknown}"}
+        if self.store:
+            return await self._submit_buffered(session_id, answers, bank)
+
+        session = (await self.db.execute(
+            select(TestSession).where(TestSession.id == session_id).with_for_update()
+        )).scalar_one_or_none()
+        if not session:
+            return {"error": "Session not found"}
+
+        trait_stats, answered_ids = await self._session_state(session, bank)
+        seen = set(answered_ids)
+        rows, skipped, touched = [], [], set()
+        for a in answers:
+            item_id = a["item_id"]
+            if item_id in seen:
+                skipped.append(item_id)
+                continue
+            seen.add(item_id)
+            item = bank.get(item_id)
+            trait_stats[item.trait] = add_to_trait_stats(trait_stats.get(item.trait), item_id, keyed_score(item, a["value"]))
+            touched.add(item.trait)
+            answered_ids.append(item_id)
+            rows.append({
+                "session_id": session_id,
+                "item_id": item_id,
+                "response_value": a["value"],
+                "response_time_ms": a["time_ms"],
+                "mouse_trajectory_entropy": a.get("mouse_trajectory_entropy"),
+            })
+
+        if rows:
+            # One multi-row INSERT ... VALUES statement; passing the rows as
+            # parameters would be an executemany on asyncpg. Items are never
+            # repeated within a session, so the row count is bounded by the bank.
+            await self.db.execute(insert(ItemResponse).values(rows))
+
+            current_thetas = dict(session.current_theta) if session.current_theta else {}
+            for trait in touched:
+                trait_stats[trait] = estimate_trait(trait_stats[trait], bank)
+                current_thetas[trait] = trait_stats[trait]["theta"]
+            session.current_theta = current_thetas
+            session.trait_stats = trait_stats
+            session.answered_items = answered_ids
+
+        next_item = self._select_next(session.current_theta, bank, answered_ids, trait_stats)
+        await self.db.commit()
+        return {
+            "saved": len(rows),
+            "skipped_item_ids": skipped,
+            "next_item": next_item,
+        }
+
+    async def _submit_buffered(self, session_id: int, answers, bank):
+        """
+        submit_batch against the session store: the answers only touch the
+        store, and are written to the DB once SESSION_FLUSH_BATCH are
+        pending or the test is finished.
+        """
+        for _ in range(3):
+            state = await self._load_state(session_id, bank)
+            if state is None:
+                return {"error": "Session not found"}
 
-    def load_ipip_data(self):
+            seen = set(state.answered_items)
+            saved, skipped, touched = 0, [], set()
+            for a in answers:
+                item_id = a["item_id"]
+                if item_id in seen:
+                    skipped.append(item_id)
+                    continue
+                seen.add(item_id)
+                item = bank.get(item_id)
+                touched.add(item.trait)
+                state.trait_stats[item.trait] = add_to_trait_stats(
+                    state.trait_stats.get(item.trait), item_id, keyed_score(item, a["value"])
+                )
+                state.answered_items.append(item_id)
+                state.add_pending({
+                    "session_id": session_id,
+                    "item_id": item_id,
+                    "response_value": a["value"],
+                    "response_time_ms": a["time_ms"],
+                    "mouse_trajectory_entropy": a.get("mouse_trajectory_entropy"),
+                })
+                saved += 1
+            for trait in touched:
+                state.trait_stats[trait] = estimate_trait(state.trait_stats[trait], bank)
+                state.current_theta[trait] = state.trait_stats[trait]["theta"]
+
+            next_item = self._select_next(state.current_theta, bank, state.answered_items, state.trait_stats)
+            if saved:
+                try:
+                    self.store.put(state)
+                except StaleState:
+                    continue # A concurrent answer for this session won; redo on its state
+            break
+        else:
+            return {"error": "Session is being updated concurrently"}
+
+        if state.pending and (next_item is None or len(state.pending) >= SESSION_FLUSH_BATCH):
+            await self.flush(session_id)
+        return {
+            "saved": saved,
+            "skipped_item_ids": skipped,
+            "next_item": next_item,
+        }
+
+    async def flush(self, session_id: int) -> int:
+        """
+        Writes a session's buffered answers and state to the DB in one
+        transaction and drops them from the store. Safe to repeat or run
+        concurrently (e.g. after a crash between commit and store update):
+        answers already in the session's answered_items are not re-inserted.
+        Returns the number of responses written.
+        """
+        if not self.store:
+            return 0
+        state = self.store.get(session_id)
+        if state is None or not state.pending:
+            return 0
+
+        session = (await self.db.execute(
+            select(TestSession).where(TestSession.id == session_id).with_for_update()
+        )).scalar_one_or_none()
+        if session is None:
+            self.store.delete(session_id)
+            return 0
+
+        in_db = set(session.answered_items or [])
+        rows = [r for r in state.pending if r["item_id"] not in in_db]
+        if rows:
+            await self.db.execute(insert(ItemResponse).values(rows))
+        session.current_theta = state.current_theta
+        session.trait_stats = state.trait_stats
+        session.answered_items = state.answered_items
+        await self.db.commit()
+
+        # Drop what was written; answers that arrived meanwhile stay pending
+        flushed = {r["item_id"] for r in state.pending}
+        for _ in range(5):
+            current = self.store.get(session_id)
+            if current is None:
+                break
+            current.pending = [r for r in current.pending if r["item_id"] not in flushed]
+            if not current.pending:
+                current.first_pending_at = None
+            try:
+                self.store.put(current)
+                break
+            except StaleState:
+                continue
+        return len(rows)
+
+    async def evict(self, session_id: int):
+        """
+        Flushes a session and drops it from the store, unless an answer
+        arrived after the flush (it stays for the next flush then).
+        Returns (responses written, dropped).
+        """
+        if not self.store:
+            return 0, False
+        flushed = await self.flush(session_id)
+        state = self.store.get(session_id)
+        if state is None:
+            return flushed, False
+        if state.pending:
+            return flushed, False
+        return flushed, self.store.delete_if_version(session_id, state.version)
+
+    async def close_session(self, session_id: int):
+        """Flushes a finished (scored) session and drops it from the store."""
+        await self.evict(session_id)
+
+    async def load_ipip_data(self):
         """Loads the JSON data into the DB if empty."""
-        count = self.db.query(PsychometricItem).count()
-        if count > 0:
+        # Ask the DB, not the cached bank: another worker may have seeded it
+        count_items = select(func.count()).select_from(PsychometricItem)
+        if await self.db.scalar(count_items):
             return # Already loaded
 
-        json_path = os.path.join(os.path.dirname(__file__), "../data/ipip50.json")
-        with open(json_path, "r") as f:
-            items = json.load(f)
+        async with _seed_lock:
+            if self.db.get_bind().dialect.name == "postgresql":
+                # Other workers wait here until our commit, then see the items
+                await self.db.execute(text("LOCK TABLE psych_items IN SHARE ROW EXCLUSIVE MODE"))
+            if await self.db.scalar(count_items):
+                await self.db.commit() # Releases the lock
+                return
+
+            json_path = os.path.join(os.path.dirname(__file__), "../data/ipip50.json")
+            with open(json_path, "r") as f:
+                items = json.load(f)
             
-        for i in items:
-            db_item = PsychometricItem(
-                text=i["text"],
-                trait=i["trait"],
-                keyed=i.get("keyed", "plus"),
-                is_validity_check=i.get("is_validity", False),
-                validity_type="lie_scale" if i.get("is_validity") else None
-            )
-            self.db.add(db_item)
-        self.db.commit()
+            for i in items:
+                db_item = PsychometricItem(
+                    text=i["text"],
+                    trait=i["trait"],
+                    keyed=i.get("keyed", "plus"),
+                    is_validity_check=i.get("is_validity", False),
+                    validity_type="lie_scale" if i.get("is_validity") else None
+                )
+                self.db.add(db_item)
+            await self.db.commit()
+            invalidate_item_bank()
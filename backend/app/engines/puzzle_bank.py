@@ -0,0 +1,168 @@
+import json
+import os
+import random
+import tempfile
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Optional, Sequence
+from app.engines.cognitive import CognitiveEngine, DIFFICULTIES, clamp_difficulty
+
+# Cognitive puzzles are precomputed once into a bank per (type, difficulty)
+# instead of being generated per request. Generation is seeded, so every
+# worker (and every restart) builds the same bank and puzzle ids are stable;
+# the bank is also saved to disk so later starts just read it back.
+
+PUZZLE_TYPES = ("abstract", "numerical", "verbal")
+PUZZLES_PER_CELL = int(os.getenv("COGNITIVE_BANK_SIZE", "500")) # per type and difficulty
+COGNITIVE_BANK_SEED = int(os.getenv("COGNITIVE_BANK_SEED", "20240601"))
+COGNITIVE_BANK_PATH = os.getenv("COGNITIVE_BANK_PATH", os.path.join(tempfile.gettempdir(), "cognitive_bank.json"))
+# Bump when a generator changes, so banks saved by older code are rebuilt
+GENERATOR_VERSION = 2
+
+_generators = {
+    "abstract": "generate_abstract_matrix",
+    "numerical": "generate_numerical_series",
+    "verbal": "generate_verbal_syllogism",
+}
+
+def _stem_key(puzzle: dict) -> str:
+    """Identity of a puzzle for de-duplication: the question, not the option order."""
+    stem = {k: v for k, v in puzzle.items() if k not in ("id", "options", "correct_index")}
+    stem["answer"] = puzzle["options"][puzzle["correct_index"]]
+    return json.dumps(stem, sort_keys=True, ensure_ascii=False)
+
+def generate_cell(puzzle_type: str, difficulty: int, size: int, seed: int) -> List[dict]:
+    """Up to `size` distinct puzzles (fewer if the generator runs out of variety)."""
+    engine = CognitiveEngine()
+    generate = getattr(engine, _generators[puzzle_type])
+    rng = random.Random(f"{seed}:{puzzle_type}:{difficulty}")
+
+    puzzles, seen = [], set()
+    attempts = 0
+    while len(puzzles) < size and attempts < size * 20:
+        attempts += 1
+        puzzle = generate(difficulty, rng)
+        key = _stem_key(puzzle)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        # Shuffle options once, here, with the bank's rng
+        options = puzzle["options"]
+        correct_option = options[puzzle["correct_index"]]
+        rng.shuffle(options)
+        puzzle["correct_index"] = options.index(correct_option)
+        puzzle["difficulty"] = difficulty
+        puzzle["id"] = f"{puzzle_type}-{difficulty}-{len(puzzles):04d}"
+        puzzles.append(puzzle)
+    return puzzles
+
+
+class PuzzleBank:
+    """Read-only puzzles indexed by id and by (type, difficulty)."""
+
+    def __init__(self, cells: Dict[str, List[dict]], seed: int):
+        self.seed = seed
+        by_id = {}
+        by_cell = {}
+        for cell, puzzles in cells.items():
+            by_cell[cell] = tuple(p["id"] for p in puzzles)
+            for p in puzzles:
+                by_id[p["id"]] = p
+        self.by_id = MappingProxyType(by_id)
+        self.by_cell = MappingProxyType(by_cell)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    @staticmethod
+    def cell(puzzle_type: str, difficulty: int) -> str:
+        return f"{puzzle_type}:{difficulty}"
+
+    def get(self, puzzle_id: str) -> Optional[dict]:
+        puzzle = self.by_id.get(puzzle_id)
+        return dict(puzzle) if puzzle else None
+
+    def sample(self, puzzle_type: str, difficulty: int, rng=None, exclude=(), allow_repeat: bool = True) -> Optional[dict]:
+        """
+        A random puzzle of the type/difficulty, avoiding ids in `exclude`.
+        Once all of them are excluded it repeats one, or returns None
+        with allow_repeat=False.
+        """
+        ids = self.by_cell.get(self.cell(puzzle_type, clamp_difficulty(difficulty)), ())
+        rng = rng or random
+        fresh = [i for i in ids if i not in exclude] if exclude else ids
+        if not fresh and allow_repeat:
+            fresh = ids
+        return self.get(rng.choice(fresh)) if fresh else None
+
+    def build_form(self, n_items: int, types: Sequence[str] = PUZZLE_TYPES,
+                   difficulty: Optional[int] = None, seed: Optional[int] = None) -> List[dict]:
+        """
+        A test form of up to n_items puzzles, types in rotation, no repeats:
+        slots whose type/difficulty has run out of puzzles are skipped, so
+        the form can be shorter than asked. Without a fixed difficulty the
+        form ramps from easy to hard. The same seed always gives the same form.
+        """
+        rng = random.Random(seed)
+        items, used = [], set()
+        for n in range(n_items):
+            if difficulty is None:
+                level = DIFFICULTIES[min(n * len(DIFFICULTIES) // max(n_items, 1), len(DIFFICULTIES) - 1)]
+            else:
+                level = difficulty
+            puzzle = self.sample(types[n % len(types)], level, rng, used, allow_repeat=False)
+            if puzzle is None:
+                continue
+            used.add(puzzle["id"])
+            items.append(puzzle)
+        return items
+
+
+def build_puzzle_bank(size: int = PUZZLES_PER_CELL, seed: int = COGNITIVE_BANK_SEED) -> PuzzleBank:
+    cells = {
+        PuzzleBank.cell(t, d): generate_cell(t, d, size, seed)
+        for t in PUZZLE_TYPES
+        for d in DIFFICULTIES
+    }
+    return PuzzleBank(cells, seed)
+
+def _load(path: str, size: int, seed: int) -> Optional[PuzzleBank]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (data.get("version"), data.get("seed"), data.get("size")) != (GENERATOR_VERSION, seed, size):
+        return None # Built by other code/settings
+    return PuzzleBank(data["cells"], seed)
+
+def _save(bank: PuzzleBank, path: str, size: int):
+    cells = {cell: [bank.by_id[i] for i in ids] for cell, ids in bank.by_cell.items()}
+    data = {"version": GENERATOR_VERSION, "seed": bank.seed, "size": size, "cells": cells}
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not save cognitive bank to {path}: {e}")
+
+
+_bank: Optional[PuzzleBank] = None
+_lock = threading.Lock()
+
+def get_puzzle_bank() -> PuzzleBank:
+    """The process-wide bank: loaded from disk, or generated (and saved) on first use."""
+    global _bank
+    bank = _bank
+    if bank is not None:
+        return bank
+    with _lock:
+        if _bank is None:
+            bank = _load(COGNITIVE_BANK_PATH, PUZZLES_PER_CELL, COGNITIVE_BANK_SEED)
+            if bank is None:
+                bank = build_puzzle_bank()
+                _save(bank, COGNITIVE_BANK_PATH, PUZZLES_PER_CELL)
+            _bank = bank
+        return _bank
@@ -0,0 +1,254 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+# Write-behind store for in-progress test sessions. With a store enabled,
+# answers update the session state here and are only written to Postgres
+# (item_responses + the test_sessions row) in batches: every
+# SESSION_FLUSH_BATCH answers, when the test finishes or is scored, when a
+# session has had unflushed answers for SESSION_FLUSH_SECONDS, and when it
+# goes idle (abandoned) for SESSION_IDLE_SECONDS.
+#
+#   SESSION_STORE=none    write-through, every answer is a DB write (default)
+#   SESSION_STORE=memory  per-process dict; needs sticky sessions with several
+#                         workers and loses unflushed answers if the process dies
+#   SESSION_STORE=sqlite  a local SQLite file shared by all workers on the host
+#                         (stand-in for Redis); unflushed answers survive a
+#                         crash and are flushed on the next start
+
+SESSION_STORE = os.getenv("SESSION_STORE", "none")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "session_state.db"))
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "10"))
+SESSION_FLUSH_SECONDS = int(os.getenv("SESSION_FLUSH_SECONDS", "30"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+
+@dataclass
+class SessionState:
+    session_id: int
+    current_theta: Dict[str, float]
+    trait_stats: Dict[str, dict]
+    answered_items: List[int]
+    pending: List[dict] = field(default_factory=list) # item_responses rows not yet in the DB
+    first_pending_at: Optional[float] = None
+    touched_at: float = field(default_factory=time.time)
+    version: int = 0 # bumped on every put, for compare-and-set
+
+    def add_pending(self, row: dict):
+        if not self.pending:
+            self.first_pending_at = time.time()
+        self.pending.append(row)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "SessionState":
+        state = json.loads(data)
+        # JSON object keys are strings; trait names already are
+        return cls(**state)
+
+
+class StaleState(Exception):
+    """The state changed since it was read (another request/worker wrote it)."""
+
+
+class InProcessSessionStore:
+    def __init__(self):
+        self._states: Dict[int, str] = {} # JSON, so callers never share objects
+        self._lock = threading.Lock()
+
+    def get(self, session_id: int) -> Optional[SessionState]:
+        data = self._states.get(session_id)
+        return SessionState.from_json(data) if data else None
+
+    def put(self, state: SessionState):
+        """Saves `state` if nobody saved a newer version since it was read."""
+        with self._lock:
+            data = self._states.get(state.session_id)
+            current = SessionState.from_json(data).version if data else 0
+            if current != state.version:
+                raise StaleState()
+            state.version += 1
+            state.touched_at = time.time()
+            self._states[state.session_id] = state.to_json()
+
+    def delete(self, session_id: int):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def delete_if_version(self, session_id: int, version: int) -> bool:
+        """Deletes the state only if nobody saved it since `version` was read."""
+        with self._lock:
+            data = self._states.get(session_id)
+            if data is None or SessionState.from_json(data).version != version:
+                return False
+            del self._states[session_id]
+            return True
+
+    def states(self) -> List[SessionState]:
+        return [SessionState.from_json(d) for d in list(self._states.values())]
+
+
+class SqliteSessionStore:
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " session_id INTEGER PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        # One short-lived connection per call: safe across threads and forks
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, session_id: int) -> Optional[SessionState]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT data FROM session_state WHERE session_id = ?", (session_id,)).fetchone()
+        finally:
+            conn.close()
+        return SessionState.from_json(row[0]) if row else None
+
+    def put(self, state: SessionState):
+        expected = state.version
+        state.version += 1
+        state.touched_at = time.time()
+        conn = self._connect()
+        try:
+            if expected == 0:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO session_state (session_id, version, data) VALUES (?, ?, ?)",
+                    (state.session_id, state.version, state.to_json()),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE session_state SET version = ?, data = ? WHERE session_id = ? AND version = ?",
+                    (state.version, state.to_json(), state.session_id, expected),
+                )
+        finally:
+            conn.close()
+        if cur.rowcount != 1:
+            state.version = expected
+            raise StaleState()
+
+    def delete(self, session_id: int):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+        finally:
+            conn.close()
+
+    def delete_if_version(self, session_id: int, version: int) -> bool:
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "DELETE FROM session_state WHERE session_id = ? AND version = ?", (session_id, version)
+            )
+        finally:
+            conn.close()
+        return cur.rowcount == 1
+
+    def states(self) -> List[SessionState]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT data FROM session_state").fetchall()
+        finally:
+            conn.close()
+        return [SessionState.from_json(r[0]) for r in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """The configured store, or None for write-through (SESSION_STORE=none)."""
+    global _store
+    if SESSION_STORE in ("", "none"):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE == "memory":
+                    _store = InProcessSessionStore()
+                elif SESSION_STORE == "sqlite":
+                    _store = SqliteSessionStore(SESSION_STORE_PATH)
+                else:
+                    raise ValueError(f"Unknown SESSION_STORE '{SESSION_STORE}'")
+    return _store
+
+
+def session_store_stats() -> dict:
+    store = get_session_store()
+    if store is None:
+        return {"store": "none"}
+    states = store.states()
+    now = time.time()
+    return {
+        "store": SESSION_STORE,
+        "active_sessions": len(states),
+        "pending_responses": sum(len(s.pending) for s in states),
+        "oldest_pending_seconds": round(max((now - s.first_pending_at for s in states if s.first_pending_at), default=0), 1),
+        "flush_batch": SESSION_FLUSH_BATCH,
+        "flush_seconds": SESSION_FLUSH_SECONDS,
+        "idle_seconds": SESSION_IDLE_SECONDS,
+    }
+
+
+# --- Background flushing ---
+
+async def flush_due_sessions(final: bool = False) -> dict:
+    """
+    Flushes sessions whose oldest unflushed answer is older than
+    SESSION_FLUSH_SECONDS, and flushes + evicts sessions idle for
+    SESSION_IDLE_SECONDS (abandoned). With final=True (startup recovery,
+    shutdown) every session with unflushed answers is flushed.
+    """
+    from app.database import AsyncSessionLocal
+    from app.engines.psychometric import PsychometricEngine
+
+    store = get_session_store()
+    if store is None:
+        return {"flushed": 0, "evicted": 0}
+
+    now = time.time()
+    flushed = evicted = 0
+    async with AsyncSessionLocal() as db:
+        engine = PsychometricEngine(db, store=store)
+        for state in store.states():
+            idle = now - state.touched_at >= SESSION_IDLE_SECONDS
+            due = state.pending and (final or idle or now - (state.first_pending_at or now) >= SESSION_FLUSH_SECONDS)
+            try:
+                if idle:
+                    count, dropped = await engine.evict(state.session_id)
+                    flushed += count
+                    evicted += dropped
+                elif due:
+                    flushed += await engine.flush(state.session_id)
+            except Exception as e:
+                await db.rollback()
+                print(f"Flushing session {state.session_id} failed: {e}")
+    return {"flushed": flushed, "evicted": evicted}
+
+async def run_flusher(stop):
+    """Runs flush_due_sessions periodically until the `stop` event is set."""
+    import asyncio
+    interval = max(1, min(SESSION_FLUSH_SECONDS, SESSION_IDLE_SECONDS) / 2)
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await flush_due_sessions(final=stop.is_set())
+        except Exception as e:
+            print(f"Session flusher failed: {e}")
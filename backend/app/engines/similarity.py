@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.database import on_commit_inserts
+from app.models import CandidateProfile
+
+# "Find candidates like this one": nearest neighbours over the normalized
+# OCEAN + Logic_Reasoning vector of each candidate's latest profile.
+SIMILARITY_TRAITS = (
+    "Openness",
+    "Conscientiousness",
+    "Extraversion",
+    "Agreeableness",
+    "Neuroticism",
+    "Logic_Reasoning",
+)
+
+def profile_vector(scores: Dict) -> np.ndarray:
+    """Scores on 0-100 mapped to [0, 1]; missing/non-numeric -> 0.5."""
+    values = []
+    for trait in SIMILARITY_TRAITS:
+        v = (scores or {}).get(trait)
+        if not isinstance(v, (int, float)) or isinstance(v, bool):
+            v = 50
+        values.append(v)
+    return np.clip(np.array(values, dtype=np.float64) / 100.0, 0.0, 1.0)
+
+MAX_DISTANCE = float(np.sqrt(len(SIMILARITY_TRAITS)))
+
+def _kdtree(vectors: np.ndarray):
+    # scipy.spatial costs ~0.25 s to import; only the index build needs it
+    from scipy.spatial import cKDTree
+    return cKDTree(vectors)
+
+
+class CandidateIndex:
+    """
+    In-process kd-tree over candidate trait vectors.
+
+    cKDTree is static, so new profiles go to an append buffer that is
+    brute-forced at query time, and superseded profiles are tombstoned.
+    Once buffer + tombstones exceed `rebuild_ratio` of the index, the tree
+    is rebuilt from the live rows in a background thread.
+    """
+
+    def __init__(self, rebuild_ratio: float = 0.05, min_rebuild: int = 1024):
+        self.rebuild_ratio = rebuild_ratio
+        self.min_rebuild = min_rebuild
+        self._lock = threading.RLock()
+        self.ready = False
+        self._building = False
+        self._generation = 0 # bumped per build/rebuild; stale ones are discarded
+        self.max_profile_id = 0 # newest profile seen, for sync_candidate_index
+        self._early_rows = []
+        self._reset()
+
+    def _reset(self, capacity: int = 1024):
+        self._vectors = np.empty((capacity, len(SIMILARITY_TRAITS)), dtype=np.float64)
+        self._candidate_ids = np.empty(capacity, dtype=np.int64)
+        self._profile_ids = np.empty(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._size = 0
+        self._row_of_candidate: Dict[int, int] = {}
+        self._tree = None # scipy.spatial.cKDTree
+        self._tree_size = 0 # rows [0, _tree_size) are in the tree
+        self._dead_in_tree = 0
+
+    def __len__(self):
+        return len(self._row_of_candidate)
+
+    def _append(self, candidate_id: int, profile_id: int, vector: np.ndarray):
+        if self._size == len(self._alive):
+            capacity = len(self._alive) * 2
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._candidate_ids = np.resize(self._candidate_ids, capacity)
+            self._profile_ids = np.resize(self._profile_ids, capacity)
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+
+        row = self._size
+        self._vectors[row] = vector
+        self._candidate_ids[row] = candidate_id
+        self._profile_ids[row] = profile_id
+        self._alive[row] = True
+        self._size += 1
+        return row
+
+    def _upsert(self, candidate_id: int, profile_id: int, scores: Dict):
+        old = self._row_of_candidate.get(candidate_id)
+        self.max_profile_id = max(self.max_profile_id, profile_id)
+        if old is not None:
+            if self._profile_ids[old] >= profile_id:
+                return # Already have this or a newer profile
+            self._alive[old] = False
+            if old < self._tree_size:
+                self._dead_in_tree += 1
+        self._row_of_candidate[candidate_id] = self._append(candidate_id, profile_id, profile_vector(scores))
+
+    def _maybe_rebuild(self):
+        # Caller holds the lock. This runs in the after_commit hook, i.e. on
+        # the event loop of the request that wrote the profile, so the tree
+        # is rebuilt in a background thread and swapped in like build().
+        stale = (self._size - self._tree_size) + self._dead_in_tree
+        if not self._building and stale > max(self.min_rebuild, self.rebuild_ratio * self._size):
+            self._building = True
+            self._generation += 1
+            threading.Thread(
+                target=self._rebuild_in_background, args=(self._generation,),
+                name="candidate-index-rebuild", daemon=True,
+            ).start()
+
+    def _rebuild_in_background(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return # Superseded by a full build()
+            # Compact to live rows; upserts from now on are replayed after the swap
+            live = np.flatnonzero(self._alive[:self._size])
+            candidate_ids = self._candidate_ids[live]
+            profile_ids = self._profile_ids[live]
+            vectors = self._vectors[live]
+            self._early_rows = []
+        self._swap_in(generation, candidate_ids, profile_ids, vectors)
+
+    def _swap_in(self, generation: int, candidate_ids, profile_ids, vectors: np.ndarray):
+        """
+        Builds the new arrays, lookup and tree outside the lock, then
+        installs them and replays the profiles written meanwhile.
+        """
+        n = len(candidate_ids)
+        # Headroom, so inserts until the next rebuild don't have to grow the arrays
+        capacity = max(1024, n + n // 4)
+        new_vectors = np.empty((capacity, len(SIMILARITY_TRAITS)), dtype=np.float64)
+        new_vectors[:n] = vectors
+        new_candidate_ids = np.empty(capacity, dtype=np.int64)
+        new_candidate_ids[:n] = candidate_ids
+        new_profile_ids = np.empty(capacity, dtype=np.int64)
+        new_profile_ids[:n] = profile_ids
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:n] = True
+        row_of_candidate = {c: r for r, c in enumerate(new_candidate_ids[:n].tolist())}
+        tree = _kdtree(new_vectors[:n]) if n else None
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._vectors = new_vectors
+            self._candidate_ids = new_candidate_ids
+            self._profile_ids = new_profile_ids
+            self._alive = alive
+            self._size = n
+            self._row_of_candidate = row_of_candidate
+            self._tree = tree
+            self._tree_size = n
+            self._dead_in_tree = 0
+            if n:
+                self.max_profile_id = max(self.max_profile_id, int(new_profile_ids[:n].max()))
+
+            # Profiles written while we were loading
+            for row in self._early_rows:
+                self._upsert(*row)
+            self._early_rows = []
+            self._building = False
+            self.ready = True
+            self._maybe_rebuild()
+
+    def build(self, rows):
+        """
+        Replaces the index with (candidate_id, profile_id, scores) rows.
+        Rows are decoded and the tree is built outside the lock, so queries
+        keep being served from the old index meanwhile.
+        """
+        with self._lock:
+            self._building = True
+            self._generation += 1
+            generation = self._generation
+            self._early_rows = []
+
+        candidate_ids, profile_ids, vectors = [], [], []
+        for candidate_id, profile_id, scores in rows:
+            candidate_ids.append(candidate_id)
+            profile_ids.append(profile_id)
+            vectors.append(profile_vector(scores))
+        n = len(candidate_ids)
+        vectors = np.array(vectors, dtype=np.float64).reshape(n, len(SIMILARITY_TRAITS))
+        self._swap_in(generation, candidate_ids, profile_ids, vectors)
+
+    def upsert(self, candidate_id: int, profile_id: int, scores: Dict):
+        with self._lock:
+            if self._building:
+                self._early_rows.append((candidate_id, profile_id, scores))
+            if not self.ready:
+                return
+            self._upsert(candidate_id, profile_id, scores)
+            self._maybe_rebuild()
+
+    def vector_of(self, candidate_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._row_of_candidate.get(candidate_id)
+            return None if row is None else self._vectors[row].copy()
+
+    def query(self, vector: np.ndarray, k: int = 10, exclude_candidate: int = None) -> List[Tuple[int, int, float]]:
+        """k nearest live profiles as (candidate_id, profile_id, distance)."""
+        with self._lock:
+            # Brute force over the append buffer
+            buffer_hits = []
+            if self._size > self._tree_size:
+                buf = self._vectors[self._tree_size:self._size]
+                dist = np.sqrt(((buf - vector) ** 2).sum(axis=1))
+                buffer_hits = list(zip(range(self._tree_size, self._size), dist.tolist()))
+
+            # Widen the tree query until tombstones/the excluded row are covered
+            want = k + 1
+            while True:
+                tree_hits = []
+                if self._tree is not None:
+                    dist, rows = self._tree.query(vector, k=min(want, self._tree_size))
+                    dist, rows = np.atleast_1d(dist), np.atleast_1d(rows)
+                    tree_hits = list(zip(rows.tolist(), dist.tolist()))
+
+                results = []
+                for row, d in sorted(tree_hits + buffer_hits, key=lambda h: h[1]):
+                    if not self._alive[row]:
+                        continue
+                    candidate_id = int(self._candidate_ids[row])
+                    if candidate_id == exclude_candidate:
+                        continue
+                    results.append((candidate_id, int(self._profile_ids[row]), d))
+                    if len(results) == k:
+                        break
+
+                if len(results) == k or want >= self._tree_size:
+                    return results
+                want *= 4
+
+
+# One index per worker process
+candidate_index = CandidateIndex()
+
+def rebuild_candidate_index(db: Session):
+    """(Re)loads the index from the latest profile of every candidate."""
+    from app.engines.matchmaker import latest_profiles_query
+    rows = db.execute(latest_profiles_query().execution_options(yield_per=10000))
+    candidate_index.build((r.candidate_id, r.id, r.scores) for r in rows)
+
+# Profiles written by other workers never reach this worker's after_commit
+# hook, so the index also pulls new profiles from the DB periodically. The
+# lookback re-reads recent ids, covering transactions that committed out of
+# id order (re-reading a profile the index already has is a no-op).
+CANDIDATE_INDEX_SYNC_SECONDS = float(os.getenv("CANDIDATE_INDEX_SYNC_SECONDS", "30"))
+CANDIDATE_INDEX_SYNC_LOOKBACK = 1000
+
+def sync_candidate_index(db: Session) -> int:
+    """Adds profiles written since the newest one in the index; returns how many were read."""
+    since = candidate_index.max_profile_id - CANDIDATE_INDEX_SYNC_LOOKBACK
+    rows = db.execute(
+        select(CandidateProfile.candidate_id, CandidateProfile.id, CandidateProfile.scores)
+        .where(CandidateProfile.id > since)
+        .order_by(CandidateProfile.id)
+    ).all()
+    for candidate_id, profile_id, scores in rows:
+        candidate_index.upsert(candidate_id, profile_id, dict(scores or {}))
+    return len(rows)
+
+_index_thread_pid = None
+
+def rebuild_candidate_index_in_background():
+    """
+    Builds this process's index without delaying API readiness, then keeps
+    it in sync with the DB. Started once per process (a forked worker starts
+    its own; threads don't survive fork).
+    """
+    global _index_thread_pid
+    from app.database import SessionLocal
+    if _index_thread_pid == os.getpid():
+        return
+    _index_thread_pid = os.getpid()
+
+    def run():
+        while not candidate_index.ready:
+            db = SessionLocal()
+            try:
+                rebuild_candidate_index(db)
+            except Exception as e:
+                print(f"Candidate index build failed: {e}")
+                time.sleep(CANDIDATE_INDEX_SYNC_SECONDS)
+            finally:
+                db.close()
+        while True:
+            time.sleep(CANDIDATE_INDEX_SYNC_SECONDS)
+            db = SessionLocal()
+            try:
+                sync_candidate_index(db)
+            except Exception as e:
+                print(f"Candidate index sync failed: {e}")
+            finally:
+                db.close()
+
+    threading.Thread(target=run, name="candidate-index", daemon=True).start()
+
+
+# Keep the index current when profiles are written through the ORM
+on_commit_inserts(
+    CandidateProfile,
+    lambda p: (p.candidate_id, p.id, dict(p.scores or {})),
+    lambda row: candidate_index.upsert(*row),
+)
@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+import numpy as np
+from app.engines.audio import split_speech
+from app.engines.language_cache import transcription_cache
+
+# Whisper inference is CPU-bound and blocks for seconds, so it runs in a
+# pool of worker processes (each with the model preloaded), fed by a bounded
+# queue. The API only submits jobs and waits on them asynchronously.
+#
+# Jobs live in the memory of the API process that accepted them, so with
+# several API workers clients must poll the same worker (sticky sessions),
+# or use the blocking /analyze/audio endpoint.
+
+def _cpus_per_api_worker() -> int:
+    """CPUs this process may use, shared with the other gunicorn workers."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return max(1, cpus // int(os.getenv("WEB_CONCURRENCY", "1")))
+
+def _default_workers() -> int:
+    """One worker per WHISPER_THREADS (profile threads, 1 if unset) of this API worker's CPU share."""
+    from app.engines.whisper_profiles import active_profile
+    return max(1, _cpus_per_api_worker() // (active_profile().threads or 1))
+
+# Chunks of one recording are transcribed in parallel across the workers
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS") or _default_workers())
+TRANSCRIBE_MAX_PENDING = int(os.getenv("TRANSCRIBE_MAX_PENDING", "16")) # queued + running
+TRANSCRIBE_JOB_TTL_SECONDS = int(os.getenv("TRANSCRIBE_JOB_TTL_SECONDS", "600"))
+# "forkserver" (default) starts workers from a clean single-threaded server
+# process, so each loads its own model. "fork" would share a model already
+# loaded in the API worker copy-on-write, but forking a process that runs
+# threads (index sync, executors) and holds torch state can deadlock the child.
+TRANSCRIBE_START_METHOD = os.getenv("TRANSCRIBE_START_METHOD", "forkserver")
+
+# --- Worker process side ---
+
+_worker_engine = None
+
+def _init_worker(threads: int):
+    global _worker_engine
+    from app.engines.whisper_profiles import active_profile
+    if not active_profile().threads:
+        # torch would use every core in every worker; split them instead
+        import torch
+        torch.set_num_threads(threads)
+    from app.engines.language import LanguageEngine
+    _worker_engine = LanguageEngine()
+    _worker_engine._load_whisper()
+
+def _analyze_audio(audio):
+    return _worker_engine.analyze_audio(audio)
+
+def _transcribe(chunk):
+    return _worker_engine.transcribe(chunk)
+
+def _build_result(texts, speaking_seconds, audio_seconds):
+    return _worker_engine.build_result(texts, speaking_seconds, audio_seconds)
+
+# --- API process side ---
+
+class QueueFull(Exception):
+    pass
+
+class TranscriptionJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued" # queued, running, done, failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        data = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+class TranscriptionService:
+    def __init__(self, workers: int = TRANSCRIBE_WORKERS, max_pending: int = TRANSCRIBE_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.jobs: Dict[str, TranscriptionJob] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._inflight: Dict[str, TranscriptionJob] = {} # cache key -> running job
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(TRANSCRIBE_START_METHOD),
+                initializer=_init_worker,
+                initargs=(max(1, _cpus_per_api_worker() // self.workers),),
+            )
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def _call(self, fn, *args):
+        """
+        Runs fn in the worker pool. If a worker died (OOM, crash in torch)
+        the whole pool is broken and fails every call, so it is replaced and
+        the call retried once on the new pool.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                if self._executor is executor: # Not yet replaced by another job
+                    print("Transcription worker died; restarting the pool")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                    self._ensure_started()
+                if attempt:
+                    raise
+
+    def _expire_jobs(self):
+        cutoff = time.time() - TRANSCRIBE_JOB_TTL_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def is_full(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def submit(self, audio) -> TranscriptionJob:
+        """
+        Queues a transcription of `audio` (decoded samples or a file path).
+        Raises QueueFull when max_pending jobs are already queued/running.
+        Audio seen before is answered from the cache without queueing, and an
+        identical recording already in flight shares that job.
+        """
+        self._expire_jobs()
+        key = None
+        if isinstance(audio, np.ndarray):
+            from app.engines.language import transcription_cache_key
+            key = transcription_cache_key(audio)
+            cached = transcription_cache.get(key)
+            if cached is not None:
+                job = TranscriptionJob()
+                job.status, job.result = "done", cached
+                job.finished_at = time.time()
+                job.done.set()
+                self.jobs[job.id] = job
+                return job
+            if key in self._inflight:
+                return self._inflight[key]
+
+        if self.is_full():
+            raise QueueFull()
+        self._ensure_started()
+
+        job = TranscriptionJob()
+        self.jobs[job.id] = job
+        self._pending += 1
+        if key:
+            self._inflight[key] = job
+        asyncio.get_running_loop().create_task(self._run(job, audio, key))
+        return job
+
+    async def _run(self, job: TranscriptionJob, audio, key: Optional[str] = None):
+        try:
+            if isinstance(audio, np.ndarray):
+                job.result = await self._run_chunked(job, audio)
+            else:
+                async with self._slots:
+                    job.status = "running"
+                    job.result = await self._call(_analyze_audio, audio)
+            job.status = "done"
+            if key:
+                transcription_cache.set(key, job.result)
+        except Exception as e:
+            print(f"Audio analysis failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            self._pending -= 1
+            if key:
+                self._inflight.pop(key, None)
+            job.finished_at = time.time()
+            job.done.set()
+
+    async def _run_chunked(self, job: TranscriptionJob, audio: np.ndarray):
+        """Transcribes the speech chunks in parallel across workers, then stitches them in order."""
+        loop = asyncio.get_running_loop()
+        # VAD is plain NumPy; keep it off the event loop all the same
+        chunks, speaking_seconds, audio_seconds = await loop.run_in_executor(None, split_speech, audio)
+
+        async def transcribe(chunk):
+            async with self._slots:
+                job.status = "running"
+                return await self._call(_transcribe, chunk)
+
+        texts = await asyncio.gather(*(transcribe(c) for c in chunks))
+        async with self._slots:
+            return await self._call(_build_result, texts, speaking_seconds, audio_seconds)
+
+    def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        self._expire_jobs()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: TranscriptionJob, timeout: Optional[float] = None) -> TranscriptionJob:
+        """Waits (without blocking the event loop) until the job finishes or timeout."""
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def stats(self) -> dict:
+        running = sum(1 for j in self.jobs.values() if j.status == "running")
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "running": running,
+            "queued": self._pending - running,
+            "cache": transcription_cache.stats(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+transcription_service = TranscriptionService()
@@ -0,0 +1,163 @@
+import argparse
+import os
+import re
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+# Whisper inference profiles: which model, how many CPU threads and how it
+# decodes. Pick one per deployment with WHISPER_PROFILE and compare them on
+# real recordings with:
+#
+#   python -m app.engines.whisper_profiles --samples ./samples
+#
+# "balanced" reproduces the original behaviour (tiny, whisper defaults).
+
+@dataclass(frozen=True)
+class WhisperProfile:
+    name: str
+    model: str # tiny, base, small, ... (or *.en)
+    threads: int = 0 # torch intra-op threads per process, 0 = torch default
+    quantize: bool = False # int8 dynamic quantization of the Linear layers
+    beam_size: Optional[int] = None # None = greedy
+    temperature_fallback: bool = True # re-decode at higher temperature on failure
+    language: Optional[str] = None # None = detect (one extra decoder pass)
+
+    @property
+    def cache_id(self) -> str:
+        """Everything that can change the transcript, for cache keys."""
+        return f"{self.model}|q={int(self.quantize)}|beam={self.beam_size}|fb={int(self.temperature_fallback)}|lang={self.language}"
+
+    def decode_options(self) -> dict:
+        options = {"fp16": False, "language": self.language}
+        if self.beam_size:
+            options.update(beam_size=self.beam_size, best_of=self.beam_size)
+        if not self.temperature_fallback:
+            options["temperature"] = 0.0
+        return options
+
+PROFILES = {
+    p.name: p for p in (
+        WhisperProfile("accurate", "base", beam_size=5),
+        WhisperProfile("balanced", "tiny"),
+        WhisperProfile("fast", "tiny", quantize=True, temperature_fallback=False, language="en"),
+        WhisperProfile("fast-base", "base", quantize=True, temperature_fallback=False, language="en"),
+    )
+}
+DEFAULT_PROFILE = "balanced"
+
+def active_profile() -> WhisperProfile:
+    """WHISPER_PROFILE, with optional WHISPER_MODEL / WHISPER_THREADS overrides."""
+    name = os.getenv("WHISPER_PROFILE", DEFAULT_PROFILE)
+    if name not in PROFILES:
+        print(f"Unknown WHISPER_PROFILE '{name}', using '{DEFAULT_PROFILE}'")
+        name = DEFAULT_PROFILE
+    profile = PROFILES[name]
+    if os.getenv("WHISPER_MODEL"):
+        profile = replace(profile, model=os.getenv("WHISPER_MODEL"))
+    if os.getenv("WHISPER_THREADS"):
+        profile = replace(profile, threads=int(os.getenv("WHISPER_THREADS")))
+    return profile
+
+def load_model(profile: WhisperProfile):
+    import torch
+    import whisper
+
+    if profile.threads:
+        torch.set_num_threads(profile.threads)
+    model = whisper.load_model(profile.model, device="cpu")
+    if profile.quantize:
+        # whisper.model.Linear only adds a dtype cast (a no-op in fp32 on
+        # CPU); turn it back into nn.Linear so the dynamic quantizer swaps it.
+        for module in model.modules():
+            if type(module) is whisper.model.Linear:
+                module.__class__ = torch.nn.Linear
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+def transcribe(model, profile: WhisperProfile, audio) -> str:
+    return model.transcribe(audio, **profile.decode_options())["text"].strip()
+
+
+# --- Benchmark ---
+
+def _words(text: str):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level edit distance / reference length (case and punctuation ignored)."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / len(ref)
+
+AUDIO_SUFFIXES = {".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac", ".mp4"}
+
+def benchmark(samples_dir: str, profile_names, reference_profile: str):
+    """
+    Transcribes every sample with each profile and prints load time,
+    real-time factor (processing time / audio duration, lower is faster) and
+    word error rate. The reference is `<sample>.txt` next to the audio when
+    present, otherwise the transcript of `reference_profile`.
+    """
+    import whisper
+    from app.engines.audio import SAMPLE_RATE
+
+    paths = sorted(p for p in Path(samples_dir).iterdir() if p.suffix.lower() in AUDIO_SUFFIXES)
+    if not paths:
+        print(f"No audio samples found in {samples_dir}")
+        return
+    samples = [(p, whisper.load_audio(str(p))) for p in paths]
+    total_audio = sum(len(a) for _, a in samples) / SAMPLE_RATE
+
+    references = {p: p.with_suffix(".txt").read_text(encoding="utf-8") for p, _ in samples if p.with_suffix(".txt").exists()}
+    names = list(profile_names)
+    if len(references) < len(samples) and reference_profile not in names:
+        names.insert(0, reference_profile)
+    names.sort(key=lambda n: n != reference_profile) # Reference transcripts first
+
+    print(f"{len(samples)} samples, {total_audio:.1f}s of audio, {len(references)} with reference transcripts")
+    print(f"{'profile':<12} {'model':<10} {'load s':>7} {'RTF':>7} {'WER':>7}")
+    for name in names:
+        profile = PROFILES[name]
+        started = time.perf_counter()
+        model = load_model(profile)
+        load_seconds = time.perf_counter() - started
+
+        processing, errors = 0.0, []
+        for path, audio in samples:
+            started = time.perf_counter()
+            text = transcribe(model, profile, audio)
+            processing += time.perf_counter() - started
+            if name == reference_profile and path not in references:
+                references[path] = text
+            if path in references:
+                errors.append(word_error_rate(references[path], text))
+
+        wer = sum(errors) / len(errors) if errors else float("nan")
+        print(f"{name:<12} {profile.model:<10} {load_seconds:>7.2f} {processing / total_audio:>7.3f} {wer:>7.3f}")
+        del model
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper inference profiles.")
+    parser.add_argument("--samples", required=True, help="Directory of audio files (optional <name>.txt references)")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma-separated profile names")
+    parser.add_argument("--reference", default="accurate", help="Profile used as reference when no .txt exists")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.profiles.split(",") if n.strip()]
+    unknown = [n for n in names + [args.reference] if n not in PROFILES]
+    if unknown:
+        parser.error(f"Unknown profiles: {', '.join(unknown)} (choose from {', '.join(PROFILES)})")
+    benchmark(args.samples, names, args.reference)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from app.startup import startup_report, timed
+
+with timed("import fastapi"):
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
 
 app = FastAPI(
     title="Talent Intelligence API",
@@ -21,13 +25,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-from app.api.endpoints import psychometric, cognitive, language, matchmaker, results
+with timed("import app.database"):
+    from app import database
+with timed("import psychometric router"):
+    from app.api.endpoints import psychometric
+with timed("import cognitive router"):
+    from app.api.endpoints import cognitive
+with timed("import language router"):
+    from app.api.endpoints import language
+with timed("import matchmaker router"):
+    from app.api.endpoints import matchmaker
+with timed("import results router"):
+    from app.api.endpoints import results
+with timed("import system router"):
+    from app.api.endpoints import system
 
 app.include_router(psychometric.router, prefix="/api/v1", tags=["psychometric"])
 app.include_router(cognitive.router, prefix="/api/v1/cognitive", tags=["cognitive"])
 app.include_router(language.router, prefix="/api/v1/language", tags=["language"])
 app.include_router(matchmaker.router, prefix="/api/v1/matchmaker", tags=["matchmaker"])
 app.include_router(results.router, prefix="/api/v1/results", tags=["results"])
+app.include_router(system.router, prefix="/api/v1/system", tags=["system"])
+
+@app.on_event("startup")
+def load_candidate_index():
+    # Builds the index and keeps it in sync; a no-op if post_fork
+    # (gunicorn.conf.py) already started it in this worker
+    from app.engines.similarity import rebuild_candidate_index_in_background
+    rebuild_candidate_index_in_background()
+
+@app.on_event("startup")
+def warmup_models():
+    # Optional (WARMUP_ON_STARTUP), in the background; /ready waits for it.
+    # Under gunicorn (gunicorn.conf.py) the models were loaded in the master,
+    # so only the per-worker DB caches are actually loaded here.
+    import threading
+    from app.startup import warmup_until_done, warmup_targets_from_env, WARMUP_TARGETS
+    targets = [t for t in warmup_targets_from_env() if t in WARMUP_TARGETS]
+    startup_report.required.update(targets)
+    if targets:
+        threading.Thread(target=warmup_until_done, args=(targets,), name="model-warmup", daemon=True).start()
+    startup_report.mark_ready()
+
+_session_flusher = None
+
+@app.on_event("startup")
+async def start_session_flusher():
+    # Write-behind session store (SESSION_STORE): first flush what a crashed
+    # or killed process left unflushed, then flush due/idle sessions periodically.
+    global _session_flusher
+    import asyncio
+    from app.engines.session_store import get_session_store, flush_due_sessions, run_flusher
+    if get_session_store() is None:
+        return
+    try:
+        recovered = await flush_due_sessions(final=True)
+        print(f"Session store recovery: {recovered}")
+    except Exception as e:
+        print(f"Session store recovery failed: {e}")
+    stop = asyncio.Event()
+    _session_flusher = (stop, asyncio.create_task(run_flusher(stop)))
+
+@app.on_event("shutdown")
+async def stop_session_flusher():
+    if _session_flusher:
+        stop, task = _session_flusher
+        stop.set() # The flusher flushes everything once more before exiting
+        await task
+
+@app.on_event("shutdown")
+def stop_transcription_workers():
+    from app.engines.transcription import transcription_service
+    transcription_service.shutdown()
 
 @app.get("/")
 async def root():
@@ -36,3 +105,9 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until startup and the configured warmup have finished."""
+    status = startup_report.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
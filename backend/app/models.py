@@ -43,6 +43,12 @@ class TestSession(Base):
     # Current theta estimates (stored as JSON)
     current_theta = Column(JSON, nullable=True) 
     
+    # Running CAT state so submits don't reload previous responses
+    # trait_stats: {"Openness": {"n": 3, "responses": [[item_id, category], ...],
+    #                             "theta": 0.41, "se": 0.62}, ...}
+    trait_stats = Column(JSON, nullable=True)
+    answered_items = Column(JSON, nullable=True) # [item_id, ...] in answer order
+    
     candidate = relationship("Candidate", back_populates="test_sessions")
     responses = relationship("ItemResponse", back_populates="session")
 
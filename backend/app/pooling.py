@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from uuid import uuid4
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Connection pool settings, from the environment.
+# We run behind Supabase's pooler, so connection exhaustion shows up as
+# checkout waits/timeouts here long before Postgres itself complains.
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30) # seconds to wait for a checkout
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800) # seconds; below the pooler's idle timeout
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = _env_int("DB_STATEMENT_TIMEOUT_MS", 0) # 0 = server default
+# PgBouncer/Supavisor in transaction mode: no server-side prepared statements
+# and no session-level startup parameters.
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", False)
+
+
+class PoolStats:
+    """Checkout counters for one pool (shared across pool re-creations)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.waits = 0 # checkouts that took longer than 10 ms
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait > 0.01:
+                self.waits += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self, pool) -> dict:
+        data = {
+            "checkouts": self.checkouts,
+            "waited_checkouts": self.waits,
+            "timeouts": self.timeouts,
+            "connections_opened": self.connects,
+            "avg_wait_ms": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 3),
+        }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+            })
+        return data
+
+
+def _instrumented(base, stats: PoolStats):
+    class InstrumentedPool(base):
+        # Pool.recreate() builds a new pool of the same class, so the stats
+        # survive engine.dispose()/invalidation.
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except exc.TimeoutError:
+                stats.record_timeout()
+                raise
+            stats.record_checkout(time.perf_counter() - started)
+            return conn
+
+    InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+    InstrumentedPool.stats = stats
+    return InstrumentedPool
+
+
+sync_pool_stats = PoolStats("sync")
+async_pool_stats = PoolStats("async")
+
+
+def engine_options(url, is_async: bool) -> dict:
+    """create_engine/create_async_engine keyword arguments for `url`."""
+    url = make_url(url)
+    stats = async_pool_stats if is_async else sync_pool_stats
+    options = {
+        "poolclass": _instrumented(AsyncAdaptedQueuePool if is_async else QueuePool, stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.get_backend_name() != "postgresql":
+        return options
+
+    connect_args = {}
+    if is_async and DB_PGBOUNCER:
+        # asyncpg prepares every statement; with transaction pooling the
+        # next transaction may land on another server connection.
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        })
+    if DB_STATEMENT_TIMEOUT_MS and not DB_PGBOUNCER:
+        # Direct connections: set it once per connection at startup
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    options["connect_args"] = connect_args
+    return options
+
+
+def instrument_engine(sync_engine, stats: PoolStats):
+    """Connection-level hooks that need an engine (not just a pool class)."""
+    event.listen(sync_engine, "connect", lambda dbapi_conn, record: stats.record_connect())
+
+    if DB_STATEMENT_TIMEOUT_MS and DB_PGBOUNCER and sync_engine.dialect.name == "postgresql":
+        # Transaction mode rejects/ignores startup options and would leak a
+        # session-level SET to other clients, so scope it to each transaction.
+        @event.listens_for(sync_engine, "begin")
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(DB_STATEMENT_TIMEOUT_MS)}")
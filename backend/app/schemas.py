@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class CandidateCreate(BaseModel):
     full_name: str
@@ -28,3 +28,20 @@ class SubmitAnswerRequest(BaseModel):
 class SubmitAnswerResponse(BaseModel):
     success: bool
     next_item_id: Optional[int] = None
+    next_item: Optional[QuestionResponse] = None # None once the test is finished
+
+class BatchAnswer(BaseModel):
+    item_id: int
+    value: int # 1-5
+    time_ms: int
+    mouse_trajectory_entropy: Optional[float] = None
+
+class SubmitBatchRequest(BaseModel):
+    answers: List[BatchAnswer] # In the order they were answered
+
+class SubmitBatchResponse(BaseModel):
+    success: bool
+    saved: int
+    skipped_item_ids: List[int] = [] # Already answered, not saved again
+    next_item_id: Optional[int] = None
+    next_item: Optional[QuestionResponse] = None
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Startup-time report: how long each import / model load took in this
+# process, so cold-start regressions are visible (GET /api/v1/system/startup).
+# Heavy models (spaCy, Whisper/torch) load on first use, or up front through
+# warmup() / WARMUP_ON_STARTUP when a deployment prefers paying it at boot.
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "") # e.g. "item_bank,spacy,whisper"
+WARMUP_RETRY_SECONDS = 10
+
+class StartupReport:
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.ready_seconds = None
+        self.steps = []
+        self.warmed = set()
+        self.required = set() # warmup targets /ready waits for
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            step = {
+                "name": name,
+                "seconds": round(time.perf_counter() - started, 4),
+                "at_seconds": round(started - self._started, 4),
+                "pid": os.getpid(),
+            }
+            if error:
+                step["error"] = error
+            with self._lock:
+                self.steps.append(step)
+
+    def mark_ready(self):
+        if self.ready_seconds is None:
+            self.ready_seconds = round(time.perf_counter() - self._started, 4)
+
+    def readiness(self) -> dict:
+        pending = sorted(self.required - self.warmed)
+        return {
+            "ready": self.ready_seconds is not None and not pending,
+            "warmed": sorted(self.warmed),
+            "pending": pending,
+        }
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            steps = list(self.steps)
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "ready_seconds": self.ready_seconds,
+            "steps": steps,
+        }
+
+startup_report = StartupReport()
+timed = startup_report.timed
+
+
+def _warm_item_bank():
+    from app.database import SessionLocal
+    from app.engines.item_bank import get_item_bank
+    db = SessionLocal()
+    try:
+        get_item_bank(db)
+    finally:
+        db.close()
+
+def _warm_candidate_index():
+    from app.database import SessionLocal
+    from app.engines.similarity import candidate_index, rebuild_candidate_index
+    if candidate_index.ready:
+        return
+    db = SessionLocal()
+    try:
+        rebuild_candidate_index(db)
+    finally:
+        db.close()
+
+def _warm_cognitive_bank():
+    from app.engines.puzzle_bank import get_puzzle_bank
+    get_puzzle_bank()
+
+def _warm_spacy():
+    from app.engines.language import get_nlp
+    get_nlp()
+
+def _warm_whisper():
+    from app.engines.language import LanguageEngine
+    LanguageEngine()._load_whisper()
+
+WARMUP_TARGETS = {
+    "item_bank": _warm_item_bank,
+    "candidate_index": _warm_candidate_index,
+    "cognitive_bank": _warm_cognitive_bank,
+    "spacy": _warm_spacy,
+    "whisper": _warm_whisper,
+}
+
+# Caches of DB rows that change at runtime. Each process must load its own:
+# a copy inherited from a preloading master would be a stale boot snapshot.
+PER_WORKER_TARGETS = ("item_bank", "candidate_index")
+
+def warmup(targets) -> list:
+    """Loads the given heavy models now; returns the ones that were loaded."""
+    loaded = []
+    for name in targets:
+        load = WARMUP_TARGETS.get(name)
+        if load is None:
+            print(f"Unknown warmup target '{name}'")
+            continue
+        try:
+            with timed(f"warmup:{name}"):
+                load()
+            loaded.append(name)
+            startup_report.warmed.add(name)
+        except Exception as e:
+            print(f"Warmup of {name} failed: {e}")
+    return loaded
+
+def warmup_until_done(targets):
+    """warmup(), retrying failed targets (e.g. DB not up yet) until all have loaded."""
+    remaining = list(targets)
+    while True:
+        loaded = warmup(remaining)
+        remaining = [t for t in remaining if t not in loaded and t in WARMUP_TARGETS]
+        if not remaining:
+            return
+        time.sleep(WARMUP_RETRY_SECONDS)
+
+def warmup_targets_from_env() -> list:
+    return [t.strip() for t in WARMUP_ON_STARTUP.split(",") if t.strip()]
@@ -0,0 +1,71 @@
+import gc
+import multiprocessing
+import os
+
+# Production server: gunicorn pre-forks uvicorn workers from a master that
+# has already imported the app and loaded the cognitive puzzle bank and
+# spaCy, so every worker shares those pages copy-on-write instead of
+# loading its own copy. Caches of DB rows (item bank, candidate index) are
+# loaded by each worker after the fork and kept fresh from the DB.
+#
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# Development keeps using `uvicorn app.main:app --reload`.
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# Exported so per-worker defaults (e.g. TRANSCRIBE_WORKERS) can split the CPUs
+workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Recycle workers now and then (memory growth, fragmentation); the jitter
+# keeps them from all restarting at once.
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+# Long enough for an in-flight audio analysis to finish on shutdown/recycle
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+accesslog = "-"
+
+# Models are loaded once in the master and are already warm in the workers;
+# the item bank is loaded by each worker, and /ready waits for it. Whisper
+# runs in the transcription pool, which only shares a copy loaded here when
+# it is started with fork (TRANSCRIBE_START_METHOD, see engines/transcription.py).
+_warmup = "item_bank,cognitive_bank,spacy"
+if os.getenv("TRANSCRIBE_START_METHOD", "forkserver") == "fork":
+    _warmup += ",whisper"
+os.environ.setdefault("WARMUP_ON_STARTUP", _warmup)
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported, before any worker forks
+    from app.startup import warmup, warmup_targets_from_env, PER_WORKER_TARGETS
+    from app.database import engine, async_engine
+
+    loaded = warmup([t for t in warmup_targets_from_env() if t not in PER_WORKER_TARGETS])
+    server.log.info(f"Preloaded in master: {', '.join(loaded) or 'nothing'}")
+
+    # Connections opened during warmup must not be shared with the workers
+    engine.dispose()
+    async_engine.sync_engine.dispose()
+
+    # Keep the cyclic GC from touching (and so copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.database import engine, async_engine
+    # Belt and braces: drop any pooled connection inherited from the master
+    # without closing it under the master's feet.
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+    # Per-worker DB caches: never serve a snapshot inherited from the master
+    # (or, after max_requests recycling, from boot). Load fresh ones here.
+    from app.engines.item_bank import invalidate_item_bank
+    from app.engines.similarity import rebuild_candidate_index_in_background
+    invalidate_item_bank()
+    rebuild_candidate_index_in_background()
@@ -0,0 +1,13 @@
+import numpy as np
+from app.engines.irt import LOG_PRIOR, QUAD_POINTS, posterior
+
+
+def test_map_recovers_the_mode_of_a_parabola():
+    # A log-posterior that is an exact parabola: the interpolated MAP must hit
+    # its vertex between grid points, and the SE must match its curvature.
+    modes = np.array([0.37, -1.13, 2.05])
+    log_post = -0.5 * ((QUAD_POINTS[None, :] - modes[:, None]) / 0.8) ** 2
+    theta, se = posterior(log_post - LOG_PRIOR, "map")
+    np.testing.assert_allclose(theta, modes, atol=1e-9)
+    np.testing.assert_allclose(se, 0.8, atol=1e-9)
+
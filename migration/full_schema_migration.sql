@@ -142,6 +142,8 @@ CREATE TABLE public.test_sessions (
     end_time TIMESTAMP WITH TIME ZONE,
     status TEXT DEFAULT 'in_progress',
     current_theta JSONB,
+    trait_stats JSONB,
+    answered_items JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 ALTER TABLE public.test_sessions ENABLE ROW LEVEL SECURITY;
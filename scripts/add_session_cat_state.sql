@@ -0,0 +1,11 @@
+-- Add running CAT state columns to test_sessions if they don't exist
+-- (per-trait sufficient statistics and answered item ids)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'test_sessions' AND column_name = 'trait_stats') THEN
+        ALTER TABLE test_sessions ADD COLUMN trait_stats JSONB;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'test_sessions' AND column_name = 'answered_items') THEN
+        ALTER TABLE test_sessions ADD COLUMN answered_items JSONB;
+    END IF;
+END $$;
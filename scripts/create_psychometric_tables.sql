@@ -19,6 +19,8 @@ CREATE TABLE IF NOT EXISTS public.test_sessions (
     end_time TIMESTAMP WITH TIME ZONE,
     status TEXT DEFAULT 'in_progress',
     current_theta JSONB,
+    trait_stats JSONB,
+    answered_items JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 